@@ -1,126 +1,2475 @@
 import sys
+import time
+# Taken before the remaining imports so --profile-startup can report how long they take
+STARTUP_MARKS = [("process start", time.perf_counter())]
 import math
-import yt_dlp
+import argparse
+import asyncio
+import csv
 import os
 import json
-import urllib.request
+import re
+import urllib.parse
+import http.client
+import hashlib
+import hmac
+from collections import OrderedDict, deque
 import datetime
+import glob
+import itertools
+import random
+import secrets
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from http import HTTPStatus
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLineEdit, QComboBox, QLabel,
-                             QProgressBar, QFileDialog, QStyle, QScrollArea,
+                             QProgressBar, QFileDialog, QStyle,
                              QGroupBox, QGridLayout, QCheckBox, QTabWidget, QTabBar, QStackedWidget,
                              QTableWidget, QTableWidgetItem, QDialog, QHeaderView,
-                             QMenuBar, QAction, QDialogButtonBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QUrl, QSettings, QSize
-from PyQt5.QtGui import QIcon, QPixmap, QDesktopServices
+                             QMenuBar, QAction, QDialogButtonBox, QSpinBox, QTableView, QListView)
+from PyQt5.QtCore import (Qt, QObject, QThread, QAbstractTableModel, QAbstractListModel, QModelIndex,
+                          QSortFilterProxyModel, pyqtSignal, QTimer, QEventLoop, QUrl, QSettings, QSize)
+from PyQt5.QtGui import QIcon, QPixmap, QImage, QDesktopServices
+STARTUP_MARKS.append(("imports", time.perf_counter()))
+
+METADATA_PREFETCH_WORKERS = 4
+METADATA_PREFETCH_AHEAD = 4
+IMPORT_WORKERS = 4
+IMPORT_FLUSH_INTERVAL_MS = 250
+URL_LIST_SUFFIXES = ('.txt', '.csv')
+URL_COLUMN_HEADERS = {'url', 'urls', 'link', 'links'}
+METADATA_CACHE_TTL = 6 * 60 * 60
+PLAYLIST_CACHE_TTL = 30 * 60
+PLAYLIST_PAGE_SIZE = 100
+PLAYLIST_PAGE_INTERVAL = 0.5
+METADATA_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# How long a fresh extraction's format URLs are trusted before a download extracts again
+INFO_REUSE_MAX_AGE = 30 * 60
+
+CACHED_INFO_FIELDS = ('id', 'title', 'duration', 'thumbnail', 'webpage_url', 'url', 'extractor_key', 'ie_key', 'is_live', '_type')
+CACHED_FORMAT_FIELDS = ('format_id', 'ext', 'height', 'vcodec', 'acodec', 'tbr', 'abr', 'filesize', 'filesize_approx')
+TRACKING_QUERY_PARAMS = {'feature', 'si', 'pp', 'fbclid', 'gclid'}
+
+HISTORY_COMPACT_EVERY = 500
+HISTORY_PAGE_SIZE = 200
+ARCHIVE_LOOKUP_BATCH = 500
+
+THUMBNAIL_WORKERS = 4
+THUMBNAIL_TIMEOUT = 10
+THUMBNAIL_MEMORY_CACHE_SIZE = 200
+THUMBNAIL_DISK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+DEFAULT_PROGRESS_REFRESH_RATE = 4
+# A stalled read gives up after this long, which bounds how late a stalled job notices a pause or cancel
+DOWNLOAD_SOCKET_TIMEOUT = 20
+STOP_WAIT_SECONDS = 3
+BANDWIDTH_REBALANCE_INTERVAL = 1.0
+BANDWIDTH_BURST_SECONDS = 0.5
+BANDWIDTH_MIN_SHARE = 16 * 1024
+DEFAULT_MAX_FRAGMENTS = 8
+FRAGMENT_START_WORKERS = 4
+FRAGMENT_ERROR_RATE_LIMIT = 0.05
+FRAGMENTED_PROTOCOLS = ('m3u8_native', 'http_dash_segments', 'ism')
+SEGMENT_SIZE = 4 * 1024 * 1024
+SEGMENT_READ_SIZE = 64 * 1024
+SEGMENT_RETRIES = 3
+SEGMENTED_MIN_SIZE = 8 * 1024 * 1024
+POSTPROCESS_WORKERS = os.cpu_count() or 2
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 10
+RETRY_MAX_DELAY = 600
+CIRCUIT_FAILURE_THRESHOLD = 2
+CIRCUIT_BASE_COOLDOWN = 60
+CIRCUIT_MAX_COOLDOWN = 30 * 60
+THROTTLING_ERRORS = ('HTTP Error 429', 'Too Many Requests', 'HTTP Error 403', 'Forbidden', 'rate-limit', 'rate limit')
+PERMANENT_ERRORS = ('Unsupported URL', 'Video unavailable', 'Private video', 'HTTP Error 404', 'not available in your country',
+                    'members-only', 'Sign in to confirm your age')
+METRICS_RECENT_JOBS = 50
+METRICS_PEAK_WINDOW = 1.0
+API_HOST = '127.0.0.1'
+API_DEFAULT_PORT = 48765
+API_MAX_HEADERS = 100
+API_MAX_BODY = 1024 * 1024
+API_MAX_URLS = 1000
+API_REPLY_TIMEOUT = 10
+API_RECENT_RESULTS = 1000
+BENCHMARKS = ('download', 'queue', 'import', 'history', 'playlist')
+BENCHMARK_TICK_MS = 10
+PARTIAL_FILE_SUFFIXES = ('.part', '.part.segments', '.ytdl')
+DEFAULT_FILENAME_TEMPLATE = "%(title)s [%(id)s].%(ext)s"
+FORMAT_CHOICES = ["Video (MP4)", "Video (MKV)", "Audio (MP3)", "Audio (M4A)"]
+FORMAT_NAMES = {name.split('(')[1].rstrip(')').lower(): name for name in FORMAT_CHOICES}
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- STARTUP ---
+
+# yt-dlp pulls in hundreds of extractor modules, so it is imported on first use (or preloaded in the background)
+yt_dlp = None
+yt_dlp_lock = threading.Lock()
+
+def load_yt_dlp():
+    global yt_dlp
+    if yt_dlp is None:
+        with yt_dlp_lock:
+            if yt_dlp is None:
+                import yt_dlp as module
+                yt_dlp = module
+    return yt_dlp
+
+def open_settings():
+    # defaultFormat() stays NativeFormat unless run_benchmark has pointed settings at a scratch INI file
+    return QSettings(QSettings.defaultFormat(), QSettings.UserScope, "AreaVII", "VideoDownloader")
+
+def mark_startup(phase):
+    STARTUP_MARKS.append((phase, time.perf_counter()))
+
+def print_startup_profile():
+    started = previous = STARTUP_MARKS[0][1]
+    for phase, timestamp in STARTUP_MARKS[1:]:
+        print(f"{phase:<28} {(timestamp - previous) * 1000:8.1f} ms  (total {(timestamp - started) * 1000:8.1f} ms)", file=sys.stderr)
+        previous = timestamp
+
+def preload_yt_dlp(profile=False):
+    started = time.perf_counter()
+    load_yt_dlp()
+    if profile:
+        print(f"{'yt_dlp import (background)':<28} {(time.perf_counter() - started) * 1000:8.1f} ms", file=sys.stderr)
+
+# --- FORMATTING HELPERS ---
+
+def format_file_size(size_bytes):
+    if size_bytes is None or size_bytes == 0:
+        return "N/A"
+    size_name = ("B", "KB", "MB", "GB", "TB")
+    i = min(int(math.floor(math.log(size_bytes, 1024))), len(size_name) - 1)
+    p = math.pow(1024, i)
+    s = round(size_bytes / p, 2)
+    return f"{s} {size_name[i]}"
+
+def format_speed(bytes_per_second):
+    if not bytes_per_second:
+        return "N/A"
+    return f"{format_file_size(bytes_per_second)}/s"
+
+def format_eta(seconds):
+    if seconds is None:
+        return "N/A"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+# --- METADATA CACHE ---
+
+def normalize_url(url):
+    parts = urllib.parse.urlsplit(url.strip())
+    netloc = parts.netloc.lower()
+    if netloc.startswith('www.') or netloc.startswith('m.'):
+        netloc = netloc.split('.', 1)[1]
+    query = sorted((k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+                   if k not in TRACKING_QUERY_PARAMS and not k.startswith('utm_'))
+    return f"{netloc}{parts.path.rstrip('/')}?{urllib.parse.urlencode(query)}"
+
+def video_id_key(info):
+    extractor = info.get('extractor_key') or info.get('ie_key')
+    if extractor and info.get('id'):
+        return f"id:{extractor.lower()}:{info['id']}"
+    return None
+
+def strip_info(info):
+    stripped = {k: info[k] for k in CACHED_INFO_FIELDS if info.get(k) is not None}
+    if info.get('formats'):
+        stripped['formats'] = [{k: f[k] for k in CACHED_FORMAT_FIELDS if f.get(k) is not None}
+                               for f in info['formats'] if f]
+    if info.get('entries') is not None:
+        stripped['entries'] = [strip_info(entry) for entry in info['entries'] if entry]
+    return stripped
+
+class MetadataCache:
+    def __init__(self, path, ttl=METADATA_CACHE_TTL, playlist_ttl=PLAYLIST_CACHE_TTL, max_bytes=METADATA_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.playlist_ttl = playlist_ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                              "size INTEGER NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, key TEXT NOT NULL)")
+            self.conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+            self.conn.execute("DELETE FROM aliases WHERE key NOT IN (SELECT key FROM entries)")
+            self.total_size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, url=None, id_key=None):
+        aliases = [alias for alias in (id_key, url and "url:" + normalize_url(url)) if alias]
+        now = time.time()
+        try:
+            with self.lock, self.conn:
+                for alias in aliases:
+                    row = self.conn.execute("SELECT e.key, e.data, e.expires_at FROM aliases a JOIN entries e ON e.key = a.key "
+                                            "WHERE a.alias = ?", (alias,)).fetchone()
+                    if row and row[2] >= now:
+                        self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, row[0]))
+                        return json.loads(zlib.decompress(row[1]))
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            print(f"Could not read metadata cache: {e}")
+        return None
+
+    def put(self, url, info):
+        if not info or info.get('is_live'):
+            return
+        stripped = strip_info(info)
+        is_playlist = 'entries' in stripped
+        key = video_id_key(stripped) or "url:" + normalize_url(url)
+        aliases = {key, "url:" + normalize_url(url)}
+        if stripped.get('webpage_url'):
+            aliases.add("url:" + normalize_url(stripped['webpage_url']))
+        data = zlib.compress(json.dumps(stripped, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        expires_at = now + (self.playlist_ttl if is_playlist else self.ttl)
+        try:
+            with self.lock, self.conn:
+                old = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                self.total_size += len(data) - (old[0] if old else 0)
+                self.conn.execute("INSERT OR REPLACE INTO entries (key, data, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                                  (key, data, len(data), expires_at, now))
+                self.conn.executemany("INSERT OR REPLACE INTO aliases (alias, key) VALUES (?, ?)", [(a, key) for a in aliases])
+                if self.total_size > self.max_bytes:
+                    self.evict()
+        except sqlite3.Error as e:
+            print(f"Could not write metadata cache: {e}")
+
+    def evict(self):
+        # Least recently used entries go first until the cache fits again
+        evicted = []
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            if self.total_size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self.total_size -= size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self.conn.execute("DELETE FROM aliases WHERE key NOT IN (SELECT key FROM entries)")
+
+    def clear(self):
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("DELETE FROM entries")
+                self.conn.execute("DELETE FROM aliases")
+                self.total_size = 0
+        except sqlite3.Error as e:
+            print(f"Could not clear metadata cache: {e}")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def extract_info_cached(url, ydl_opts, cache=None, id_key=None, ydl=None):
+    # Callers resolving many URLs pass their own long-lived ydl (built from the same options); creating one is slow
+    if cache:
+        info = cache.get(url, id_key)
+        if info:
+            return info
+    if ydl is not None:
+        info = ydl.extract_info(url, download=False)
+    else:
+        with load_yt_dlp().YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+    if cache and info:
+        cache.put(url, info)
+    return info
+
+# --- HISTORY STORE ---
+
+class HistoryStore:
+    def __init__(self, path, legacy_json_path=None):
+        self.lock = threading.Lock()
+        self.appends_since_compact = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                              "title TEXT, url TEXT, date TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS history_date ON history (date)")
+            # extractor + video id + format choice of every finished download
+            self.conn.execute("CREATE TABLE IF NOT EXISTS archive (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.has_fts = self.create_search_index()
+        if legacy_json_path and os.path.exists(legacy_json_path):
+            self.import_json(legacy_json_path)
+
+    def create_search_index(self):
+        # Full-text index over title/URL kept in sync by triggers; fall back to LIKE if FTS5 is unavailable
+        try:
+            with self.lock, self.conn:
+                exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_fts'").fetchone()
+                self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(title, url, content='history', content_rowid='id')")
+                self.conn.execute("CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN "
+                                  "INSERT INTO history_fts (rowid, title, url) VALUES (new.id, new.title, new.url); END")
+                self.conn.execute("CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN "
+                                  "INSERT INTO history_fts (history_fts, rowid, title, url) VALUES ('delete', old.id, old.title, old.url); END")
+                if not exists:
+                    self.conn.execute("INSERT INTO history_fts (history_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.Error as e:
+            print(f"Full-text history search unavailable: {e}")
+            return False
+
+    def import_json(self, json_path):
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Could not parse history file: {e}")
+            return
+        # history.json is stored newest first; insert oldest first so ids stay chronological
+        rows = [(item.get('title'), item.get('url'), item.get('date')) for item in reversed(history)]
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany("INSERT INTO history (title, url, date) VALUES (?, ?, ?)", rows)
+            os.replace(json_path, json_path + ".imported")
+        except (sqlite3.Error, OSError) as e:
+            print(f"Could not import history file: {e}")
+
+    def append(self, item):
+        try:
+            with self.lock, self.conn:
+                row_id = self.conn.execute("INSERT INTO history (title, url, date) VALUES (?, ?, ?)",
+                                           (item.get('title'), item.get('url'), item.get('date'))).lastrowid
+            self.appends_since_compact += 1
+            if self.appends_since_compact >= HISTORY_COMPACT_EVERY:
+                self.compact()
+            return row_id
+        except sqlite3.Error as e:
+            print(f"Could not write to history store: {e}")
+            return None
+
+    def add_to_archive(self, key):
+        if not key:
+            return
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("INSERT OR IGNORE INTO archive (key) VALUES (?)", (key,))
+        except sqlite3.Error as e:
+            print(f"Could not write to download archive: {e}")
+
+    def archived(self, keys):
+        keys = [key for key in keys if key]
+        found = set()
+        try:
+            with self.lock:
+                for start in range(0, len(keys), ARCHIVE_LOOKUP_BATCH):
+                    batch = keys[start:start + ARCHIVE_LOOKUP_BATCH]
+                    found.update(row[0] for row in self.conn.execute(
+                        f"SELECT key FROM archive WHERE key IN ({','.join('?' * len(batch))})", batch))
+        except sqlite3.Error as e:
+            print(f"Could not read download archive: {e}")
+        return found
+
+    def page(self, before_id=None, limit=HISTORY_PAGE_SIZE, text='', date_from='', date_to=''):
+        # Keyset pagination (newest first) so every page costs the same regardless of history size
+        query = "SELECT h.id, h.title, h.url, h.date FROM history h"
+        conditions, params = [], []
+        terms = text.split()
+        if terms and self.has_fts:
+            query += " JOIN history_fts f ON f.rowid = h.id"
+            conditions.append("history_fts MATCH ?")
+            params.append(" ".join('"' + term.replace('"', '""') + '"*' for term in terms))
+        for term in (terms if not self.has_fts else []):
+            conditions.append("(h.title LIKE ? OR h.url LIKE ?)")
+            params += [f"%{term}%", f"%{term}%"]
+        if before_id is not None:
+            conditions.append("h.id < ?")
+            params.append(before_id)
+        if date_from:
+            conditions.append("h.date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("h.date <= ?")
+            params.append(date_to if len(date_to) > 10 else date_to + " 23:59:59")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY h.id DESC LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def compact(self):
+        self.appends_since_compact = 0
+        try:
+            with self.lock:
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                if self.conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                    self.conn.execute("VACUUM")
+        except sqlite3.Error as e:
+            print(f"Could not compact history store: {e}")
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM history")
+        self.compact()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# --- QUEUE STORE ---
+
+def queue_record(item):
+    record = strip_info(item)
+    record.update({k: v for k, v in item.items() if k.startswith(('selected_', 'retry_'))})
+    return record
+
+class QueueStore:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                              "state TEXT NOT NULL, data TEXT NOT NULL, message TEXT, updated_at REAL NOT NULL)")
+            # Anything still marked as downloading was interrupted by a crash or a forced stop;
+            # paused items keep their .part files and simply resume in the next session
+            self.conn.execute("UPDATE queue SET state = 'queued' WHERE state IN ('downloading', 'paused', 'postprocessing')")
+
+    def add(self, items, state='queued', messages=None):
+        now = time.time()
+        try:
+            with self.lock, self.conn:
+                for item, message in zip(items, messages or itertools.repeat(None)):
+                    item['queue_id'] = self.conn.execute("INSERT INTO queue (state, data, message, updated_at) VALUES (?, ?, ?, ?)",
+                                                         (state, json.dumps(queue_record(item), ensure_ascii=False), message, now)).lastrowid
+        except sqlite3.Error as e:
+            print(f"Could not write to queue store: {e}")
+
+    def set_state(self, queue_id, state, message=None):
+        if queue_id is None:
+            return
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("UPDATE queue SET state = ?, message = ?, updated_at = ? WHERE id = ?",
+                                  (state, message, time.time(), queue_id))
+        except sqlite3.Error as e:
+            print(f"Could not write to queue store: {e}")
+
+    def remove(self, queue_ids):
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany("DELETE FROM queue WHERE id = ?", [(queue_id,) for queue_id in queue_ids if queue_id is not None])
+        except sqlite3.Error as e:
+            print(f"Could not write to queue store: {e}")
+
+    def requeue_interrupted(self):
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("UPDATE queue SET state = 'queued' WHERE state IN ('downloading', 'paused')")
+        except sqlite3.Error as e:
+            print(f"Could not write to queue store: {e}")
+
+    def requeue(self, item, message):
+        # Keeps the row (and its place in id order) but stores the retry count and time with the item
+        if item.get('queue_id') is None:
+            return
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("UPDATE queue SET state = 'queued', data = ?, message = ?, updated_at = ? WHERE id = ?",
+                                  (json.dumps(queue_record(item), ensure_ascii=False), message, time.time(), item['queue_id']))
+        except sqlite3.Error as e:
+            print(f"Could not write to queue store: {e}")
+
+    def get(self, queue_id):
+        try:
+            with self.lock:
+                row = self.conn.execute("SELECT state, data, message FROM queue WHERE id = ?", (queue_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Could not read queue store: {e}")
+            return None
+        return row and (row[0], dict(json.loads(row[1]), queue_id=queue_id), row[2])
+
+    def failed(self):
+        try:
+            with self.lock:
+                rows = self.conn.execute("SELECT id, data, message FROM queue WHERE state = 'failed' ORDER BY updated_at DESC").fetchall()
+        except sqlite3.Error as e:
+            print(f"Could not read queue store: {e}")
+            return []
+        return [dict(json.loads(data), queue_id=queue_id, failure=message) for queue_id, data, message in rows]
+
+    def retry_failed(self):
+        try:
+            with self.lock, self.conn:
+                rows = self.conn.execute("SELECT id, data FROM queue WHERE state = 'failed'").fetchall()
+                for queue_id, data in rows:
+                    item = {k: v for k, v in json.loads(data).items() if not k.startswith('retry_')}
+                    self.conn.execute("UPDATE queue SET state = 'queued', data = ?, message = NULL, updated_at = ? WHERE id = ?",
+                                      (json.dumps(item, ensure_ascii=False), time.time(), queue_id))
+                return len(rows)
+        except sqlite3.Error as e:
+            print(f"Could not write to queue store: {e}")
+            return 0
+
+    def clear_failed(self):
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("DELETE FROM queue WHERE state = 'failed'")
+        except sqlite3.Error as e:
+            print(f"Could not write to queue store: {e}")
+
+    def has_unfinished(self):
+        try:
+            with self.lock:
+                return self.conn.execute("SELECT 1 FROM queue WHERE state IN ('queued', 'downloading', 'paused', 'postprocessing') LIMIT 1").fetchone() is not None
+        except sqlite3.Error as e:
+            print(f"Could not read queue store: {e}")
+            return True
+
+    def pending(self):
+        try:
+            with self.lock:
+                rows = self.conn.execute("SELECT id, data FROM queue WHERE state = 'queued' ORDER BY id").fetchall()
+        except sqlite3.Error as e:
+            print(f"Could not read queue store: {e}")
+            return []
+        return [dict(json.loads(data), queue_id=queue_id) for queue_id, data in rows]
+
+    def clear(self):
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("DELETE FROM queue")
+        except sqlite3.Error as e:
+            print(f"Could not clear queue store: {e}")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# --- FORMAT INDEX ---
+
+def format_size(f):
+    return int(f.get('filesize') or f.get('filesize_approx') or 0)
+
+# Best video per height (by tbr) and best audio (by abr), built in one pass over the formats
+class FormatIndex:
+    def __init__(self, formats):
+        self.videos = {}
+        self.audio = None
+        for f in formats or []:
+            if not f:
+                continue
+            if f.get('height') and f.get('vcodec') != 'none':
+                best = self.videos.get(f['height'])
+                if best is None or (f.get('tbr') or 0) > (best.get('tbr') or 0):
+                    self.videos[f['height']] = f
+            if f.get('acodec') != 'none' and f.get('vcodec') == 'none':
+                if self.audio is None or (f.get('abr') or 0) > (self.audio.get('abr') or 0):
+                    self.audio = f
+        self.heights = sorted(self.videos, reverse=True)
+
+    def estimate(self, audio_only, height=None):
+        audio_size = format_size(self.audio) if self.audio else 0
+        if audio_only:
+            return audio_size
+        # Same rule as the download format selector: the tallest video not above the chosen height
+        fitting = [h for h in self.heights if h <= height] if height else self.heights
+        if not fitting:
+            return audio_size
+        return format_size(self.videos[fitting[0]]) + audio_size
+
+# --- BANDWIDTH ---
+
+RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+def parse_rate(text):
+    # "500K", "2M", "1.5MB/s"; empty, "0" or "unlimited" mean no limit
+    text = (text or '').strip()
+    if not text or text.lower() in ('0', 'none', 'unlimited'):
+        return None
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?', text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid rate: {text}")
+    return int(float(match.group(1)) * RATE_UNITS[match.group(2).upper()]) or None
+
+def parse_clock(text):
+    hours, _, minutes = text.strip().partition(':')
+    if not hours.isdigit() or not (minutes or '0').isdigit() or not (0 <= int(hours) <= 24 and 0 <= int(minutes or 0) < 60):
+        raise ValueError(f"Invalid time: {text.strip()}")
+    hours, minutes = int(hours), int(minutes or 0)
+    return hours * 60 + minutes
+
+def parse_schedule(text):
+    # "09:00-18:00=2M, 22-6=unlimited"; windows may wrap past midnight
+    windows = []
+    for part in re.split(r'[,;]', text or ''):
+        if not part.strip():
+            continue
+        span, sep, rate = part.partition('=')
+        start, dash, end = span.partition('-')
+        if not sep or not dash:
+            raise ValueError(f"Invalid schedule entry: {part.strip()}")
+        windows.append((parse_clock(start), parse_clock(end), parse_rate(rate)))
+    return windows
+
+class BandwidthManager:
+    # One total cap shared by every running download. Each job pays for the bytes reported by its progress hook
+    # from its own token bucket; shares are water-filled so a job that can't use its share leaves it to the others.
+    def __init__(self, limit=None, schedule=()):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.last_measure = time.monotonic()
+        self.configure(limit, schedule)
+
+    def configure(self, limit=None, schedule=()):
+        with self.lock:
+            self.default_limit = limit
+            self.schedule = list(schedule)
+            self.rebalance(time.monotonic())
+
+    def current_limit(self):
+        now = datetime.datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, limit in self.schedule:
+            if start <= minute < end or (end < start and (minute >= start or minute < end)):
+                return limit
+        return self.default_limit
+
+    def register(self):
+        with self.lock:
+            job_id = next(self.ids)
+            now = time.monotonic()
+            self.jobs[job_id] = {'started': now, 'tokens': 0.0, 'last_refill': now, 'bytes': 0,
+                                 'rate': 0.0, 'measured': False, 'allotted': None}
+            self.rebalance(now)
+            return job_id
+
+    def unregister(self, job_id):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+            self.rebalance(time.monotonic())
+
+    def rebalance(self, now, measure=False):
+        if measure:
+            # Only jobs that ran for the whole interval get a measured rate
+            elapsed = now - self.last_measure
+            for job in self.jobs.values():
+                if job['started'] <= self.last_measure:
+                    job['rate'], job['measured'] = job['bytes'] / elapsed, True
+                job['bytes'] = 0
+            self.last_measure = now
+        self.limit = self.current_limit()
+        remaining = self.limit
+        jobs = sorted(self.jobs.values(), key=lambda job: job['rate'] if job['measured'] else float('inf'))
+        for position, job in enumerate(jobs):
+            if remaining is None:
+                job['allotted'] = None
+                continue
+            share = remaining / (len(jobs) - position)
+            if job['measured'] and job['rate'] * 1.25 < share:
+                share = job['rate'] * 1.25
+            job['allotted'] = max(share, min(BANDWIDTH_MIN_SHARE, self.limit / len(jobs)))
+            remaining = max(0, remaining - job['allotted'])
+
+    def consume(self, job_id, nbytes):
+        # Returns how long the caller should wait before reading more
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_measure >= BANDWIDTH_REBALANCE_INTERVAL:
+                self.rebalance(now, measure=True)
+            job = self.jobs.get(job_id)
+            if job is None:
+                return 0
+            job['bytes'] += nbytes
+            allotted = job['allotted']
+            if allotted is None:
+                job['tokens'], job['last_refill'] = 0.0, now
+                return 0
+            job['tokens'] = min(job['tokens'] + (now - job['last_refill']) * allotted, allotted * BANDWIDTH_BURST_SECONDS)
+            job['last_refill'] = now
+            job['tokens'] -= nbytes
+            return -job['tokens'] / allotted if job['tokens'] < 0 else 0
+
+    def allotted(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job['allotted'] if job else None
+
+    def stats(self):
+        with self.lock:
+            return {'limit': self.limit, 'actual': sum(job['rate'] for job in self.jobs.values())}
+
+# --- FRAGMENT TUNING ---
+
+class FragmentTuner:
+    # Picks concurrent_fragment_downloads for HLS/DASH jobs. In auto mode each host keeps its own worker count,
+    # tuned AIMD-style from the throughput and retry rate of finished jobs; all jobs on a host share the ceiling,
+    # and a stream that would go over it waits until another one on the same host hands its workers back.
+    def __init__(self, max_fragments=DEFAULT_MAX_FRAGMENTS, auto=True):
+        self.lock = threading.Condition()
+        self.hosts = {}
+        self.configure(max_fragments, auto)
+
+    def configure(self, max_fragments=DEFAULT_MAX_FRAGMENTS, auto=True):
+        with self.lock:
+            self.max_fragments = max(1, max_fragments)
+            self.auto = auto
+            self.lock.notify_all()
+
+    def host_state(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = {'workers': min(FRAGMENT_START_WORKERS, self.max_fragments), 'in_use': 0, 'last_rate': None}
+        return self.hosts[host]
+
+    def acquire(self, host, check_interrupted=None):
+        # Returns (workers, held): held is what was counted against the host and must go back to release()
+        with self.lock:
+            state = self.host_state(host)
+            while self.auto and state['in_use'] >= self.max_fragments:
+                self.lock.wait(0.25)
+                if check_interrupted is not None:
+                    check_interrupted()
+            if not self.auto:
+                return self.max_fragments, 0
+            workers = min(state['workers'], self.max_fragments - state['in_use'])
+            state['in_use'] += workers
+            return workers, workers
+
+    def release(self, host, held, rate=None, errors=0, fragments=0):
+        # Slots taken in auto mode are handed back even if auto tuning was switched off in the meantime
+        with self.lock:
+            if not held:
+                return
+            state = self.hosts[host]
+            state['in_use'] = max(0, state['in_use'] - held)
+            self.lock.notify_all()
+            if rate is None or not self.auto:
+                return
+            workers = held
+            if fragments and errors / fragments > FRAGMENT_ERROR_RATE_LIMIT:
+                state['workers'] = max(1, workers // 2)
+            elif state['last_rate'] is None or rate > state['last_rate'] * 1.1:
+                state['workers'] = min(self.max_fragments, workers + 1)
+            elif rate < state['last_rate'] * 0.9:
+                state['workers'] = max(1, workers - 1)
+            state['last_rate'] = rate
+
+class YtdlpLogger:
+    # Keeps yt-dlp's screen output off stdout (the --cli JSON stream) and counts retried requests
+    def __init__(self):
+        self.retries = 0
+        self.last_error = None
+
+    def debug(self, message):
+        if message.startswith('[download] Got error') or 'Retrying' in message:
+            self.retries += 1
+
+    def info(self, message):
+        pass
+
+    def warning(self, message):
+        print(message, file=sys.stderr)
+
+    def error(self, message):
+        self.last_error = message
+        print(message, file=sys.stderr)
+
+# --- HTTP CONNECTIONS ---
+
+class KeepAliveConnections:
+    # One keep-alive connection per host and worker thread
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def thread_connections(self):
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        return self.local.connections
+
+    def get(self, scheme, netloc):
+        connections = self.thread_connections()
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = connections[(scheme, netloc)] = conn_class(netloc, timeout=self.timeout)
+        return conn
+
+    def drop(self, url):
+        parts = urllib.parse.urlsplit(url)
+        conn = self.thread_connections().pop((parts.scheme, parts.netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def close_all(self):
+        connections = self.thread_connections()
+        for conn in connections.values():
+            conn.close()
+        connections.clear()
+
+    def request(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        headers = dict(headers, Connection='keep-alive')
+        for attempt in range(2):
+            conn = self.get(parts.scheme, parts.netloc)
+            try:
+                conn.request('GET', path, headers=headers)
+                return conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                # The server may have dropped an idle connection; retry once on a fresh one
+                self.drop(url)
+                if attempt:
+                    raise
+
+# --- SEGMENTED HTTP ---
+
+def write_at(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            # Each worker thread has its own descriptor, so seek + write is still positional
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+class SegmentedDownload:
+    # Fetches one file as byte ranges over several keep-alive connections, writing each range in place into a
+    # preallocated .part file. Finished segments are listed in a .segments file next to it so a paused download
+    # continues where it stopped.
+    def __init__(self, url, filename, headers=None, connections=4, progress_hook=None):
+        self.url = url
+        self.filename = filename
+        self.tmpfilename = filename + '.part'
+        self.state_path = self.tmpfilename + '.segments'
+        self.headers = dict(headers or {})
+        self.connections = max(1, connections)
+        self.progress_hook = progress_hook
+        self.http = KeepAliveConnections(DOWNLOAD_SOCKET_TIMEOUT)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.descriptors = []
+        self.stopped = False
+        self.total = None
+        self.downloaded = 0
+
+    def open_range(self, start, end, redirects=5):
+        url = self.url
+        for _ in range(redirects + 1):
+            response = self.http.request(url, dict(self.headers, Range=f"bytes={start}-{end}"))
+            if response.status not in (301, 302, 303, 307, 308):
+                # Later segments go straight to where the redirects ended
+                self.url = url
+                return response
+            response.read()
+            url = urllib.parse.urljoin(url, response.getheader('Location'))
+        raise OSError("Too many redirects")
+
+    def probe(self):
+        response = self.open_range(0, 0)
+        response.read()
+        total = (response.getheader('Content-Range') or '').rpartition('/')[2]
+        if response.status != 206 or not total.isdigit():
+            return None
+        return int(total)
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('total') == self.total and os.path.getsize(self.tmpfilename) == self.total:
+                return set(state.get('done', []))
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def save_state(self, done):
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump({'total': self.total, 'done': sorted(done)}, f)
+
+    def report(self, nbytes):
+        with self.lock:
+            self.downloaded += nbytes
+            if self.progress_hook is None:
+                return
+            elapsed = time.monotonic() - self.started
+            speed = (self.downloaded - self.resumed_bytes) / elapsed if elapsed > 0 else None
+            # Called under the lock, so a throttling hook holds back every connection at once
+            self.progress_hook({
+                'status': 'downloading', 'filename': self.filename, 'tmpfilename': self.tmpfilename,
+                'downloaded_bytes': self.downloaded, 'total_bytes': self.total, 'elapsed': elapsed, 'speed': speed,
+                'eta': int((self.total - self.downloaded) / speed) if speed else None,
+            })
+
+    def fetch_segment(self, index, start, end):
+        if not hasattr(self.local, 'fd'):
+            self.local.fd = os.open(self.tmpfilename, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+            with self.lock:
+                self.descriptors.append(self.local.fd)
+        offset = start
+        for attempt in range(SEGMENT_RETRIES):
+            try:
+                response = self.open_range(offset, end)
+                if response.status != 206:
+                    raise OSError(f"HTTP {response.status} for bytes {offset}-{end}")
+                while offset <= end:
+                    if self.stopped:
+                        raise OSError("Stopped")
+                    chunk = response.read(min(SEGMENT_READ_SIZE, end - offset + 1))
+                    if not chunk:
+                        raise OSError("Connection closed early")
+                    write_at(self.local.fd, chunk, offset)
+                    offset += len(chunk)
+                    self.report(len(chunk))
+                return index
+            except (http.client.HTTPException, OSError):
+                self.http.drop(self.url)
+                if self.stopped or attempt == SEGMENT_RETRIES - 1:
+                    raise
+            except BaseException:
+                self.http.drop(self.url)
+                raise
+
+    def run(self):
+        # Returns False without touching the disk when the server can't serve ranges or the file is too small
+        try:
+            self.total = self.probe()
+        finally:
+            self.http.close_all()
+        if not self.total or self.total < SEGMENTED_MIN_SIZE:
+            return False
+        done = self.load_state()
+        if done is None:
+            done = set()
+            with open(self.tmpfilename, 'wb') as f:
+                f.truncate(self.total)
+            self.save_state(done)
+        segments = [(index, start, min(start + SEGMENT_SIZE, self.total) - 1)
+                    for index, start in enumerate(range(0, self.total, SEGMENT_SIZE))]
+        self.downloaded = self.resumed_bytes = sum(end - start + 1 for index, start, end in segments if index in done)
+        self.started = time.monotonic()
+        pending = [segment for segment in segments if segment[0] not in done]
+        executor = ThreadPoolExecutor(max_workers=min(self.connections, max(1, len(pending))), thread_name_prefix="segment")
+        try:
+            futures = [executor.submit(self.fetch_segment, *segment) for segment in pending]
+            for future in as_completed(futures):
+                done.add(future.result())
+                self.save_state(done)
+        finally:
+            self.stopped = len(done) < len(segments)
+            executor.shutdown(cancel_futures=True)
+            for fd in self.descriptors:
+                os.close(fd)
+        if self.downloaded != self.total or os.path.getsize(self.tmpfilename) != self.total:
+            raise OSError(f"Size mismatch: got {self.downloaded} of {self.total} bytes")
+        os.replace(self.tmpfilename, self.filename)
+        os.remove(self.state_path)
+        if self.progress_hook is not None:
+            self.progress_hook({'status': 'finished', 'filename': self.filename, 'downloaded_bytes': self.total,
+                                'total_bytes': self.total, 'elapsed': time.monotonic() - self.started})
+        return True
+
+# --- RETRIES ---
+
+def item_host(item):
+    return urllib.parse.urlsplit(item.get('webpage_url') or item.get('url') or '').hostname or ''
+
+def is_throttling_error(message):
+    return any(marker in (message or '') for marker in THROTTLING_ERRORS)
+
+def is_permanent_error(message):
+    return any(marker in (message or '') for marker in PERMANENT_ERRORS)
+
+def retry_delay(attempt):
+    # Exponential backoff with jitter, so items that failed together don't all come back at once
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+class CircuitBreaker:
+    # Stops sending work to a host after repeated throttling errors. Each time it opens again the cooldown doubles;
+    # a success closes it.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def blocked_for(self, host):
+        with self.lock:
+            state = self.hosts.get(host)
+            return max(0, state['open_until'] - time.time()) if state else 0
+
+    def record_failure(self, host, throttled):
+        if not throttled:
+            return False
+        with self.lock:
+            state = self.hosts.setdefault(host, {'failures': 0, 'cooldown': CIRCUIT_BASE_COOLDOWN / 2, 'open_until': 0})
+            state['failures'] += 1
+            if state['failures'] < CIRCUIT_FAILURE_THRESHOLD:
+                return False
+            state['failures'] = 0
+            state['cooldown'] = min(CIRCUIT_MAX_COOLDOWN, state['cooldown'] * 2)
+            state['open_until'] = time.time() + state['cooldown']
+            return True
+
+    def record_success(self, host):
+        with self.lock:
+            self.hosts.pop(host, None)
+
+    def reset(self):
+        with self.lock:
+            self.hosts.clear()
+
+# --- METRICS ---
+
+# (record key, Prometheus name, help text) for the per-job timings exported as summaries
+METRIC_TIMINGS = (
+    ('metadata_seconds', 'avdl_metadata_seconds', "Time spent fetching video details, including extraction inside the download."),
+    ('time_to_first_byte', 'avdl_time_to_first_byte_seconds', "Time from the first media request of a download to its first received bytes."),
+    ('transfer_seconds', 'avdl_transfer_seconds', "Time from the first received bytes until the download finished."),
+    ('postprocess_seconds', 'avdl_postprocess_seconds', "Time spent merging, converting and moving files."),
+)
+
+class JobMetrics:
+    # Monotonic timestamps filled in by DownloadJob; transfer time and throughput are counted from the first byte.
+    # yt-dlp extracts (or re-selects formats) between download_started and the first dl() call, which counts as metadata time
+    def __init__(self, metadata_seconds=None):
+        self.metadata_seconds = metadata_seconds
+        self.download_started = None
+        self.extraction_finished = None
+        self.request_started = None
+        self.first_byte = None
+        self.download_finished = None
+        self.postprocess_started = None
+        self.postprocess_finished = None
+        self.baselines = {}
+        self.received = {}
+        self.window = None
+        self.peak_speed = 0
+        self.bytes_written = 0
+
+    def on_extracted(self):
+        if self.extraction_finished is None:
+            self.extraction_finished = time.monotonic()
+
+    def on_request(self):
+        if self.request_started is None:
+            self.request_started = time.monotonic()
+
+    def on_progress(self, key, downloaded_bytes):
+        # A resumed file first reports what is already on disk, so each file counts from its first report
+        now = time.monotonic()
+        if key not in self.baselines:
+            self.baselines[key] = downloaded_bytes
+            if self.first_byte is None:
+                self.first_byte = now
+                self.window = (now, 0)
+        self.received[key] = max(downloaded_bytes - self.baselines[key], 0)
+        # Peak speed is measured over whole-second windows; per-block speeds spike far above the real rate
+        received = sum(self.received.values())
+        if now - self.window[0] >= METRICS_PEAK_WINDOW:
+            self.peak_speed = max(self.peak_speed, (received - self.window[1]) / (now - self.window[0]))
+            self.window = (now, received)
+
+    def summary(self):
+        span = lambda start, end: round(end - start, 3) if start is not None and end is not None else None
+        transfer = span(self.first_byte, self.download_finished)
+        received = sum(self.received.values())
+        extraction = span(self.download_started, self.extraction_finished)
+        metadata = [seconds for seconds in (self.metadata_seconds, extraction) if seconds is not None]
+        return {
+            'metadata_seconds': round(sum(metadata), 3) if metadata else None,
+            'time_to_first_byte': span(self.request_started, self.first_byte),
+            'transfer_seconds': transfer,
+            'postprocess_seconds': span(self.postprocess_started, self.postprocess_finished),
+            'bytes_downloaded': received,
+            'bytes_written': self.bytes_written,
+            'avg_throughput': round(received / transfer) if transfer else None,
+            'peak_throughput': round(max(self.peak_speed, received / transfer if transfer else 0)),
+        }
+
+class MetricsRecorder:
+    # Appends one JSON line per finished job and rewrites a Prometheus text file with the session totals
+    def __init__(self, log_path=None, prometheus_path=None):
+        self.log_path = log_path
+        self.prometheus_path = prometheus_path
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.sums = {key: 0.0 for key, _, _ in METRIC_TIMINGS}
+        self.counts = {key: 0 for key, _, _ in METRIC_TIMINGS}
+        self.bytes_downloaded = 0
+        self.bytes_written = 0
+        self.peak_throughput = 0
+        self.recent = deque(maxlen=METRICS_RECENT_JOBS)
+
+    def record(self, video_info, status, metrics, message=None):
+        record = {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'title': video_info.get('title'),
+            'url': video_info.get('webpage_url') or video_info.get('url'),
+            'host': item_host(video_info),
+            'status': status,
+            **metrics.summary(),
+        }
+        if status == 'failed' and message:
+            record['message'] = message
+        with self.lock:
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+            for key, _, _ in METRIC_TIMINGS:
+                if record[key] is not None:
+                    self.sums[key] += record[key]
+                    self.counts[key] += 1
+            self.bytes_downloaded += record['bytes_downloaded']
+            self.bytes_written += record['bytes_written']
+            self.peak_throughput = max(self.peak_throughput, record['peak_throughput'])
+            self.recent.append(record)
+            try:
+                if self.log_path:
+                    with open(self.log_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if self.prometheus_path:
+                    tmp_path = f"{self.prometheus_path}.tmp"
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        f.write(self.prometheus_text())
+                    os.replace(tmp_path, self.prometheus_path)
+            except OSError as e:
+                print(f"Could not write metrics: {e}")
+        return record
+
+    def session(self):
+        with self.lock:
+            transfer = self.sums['transfer_seconds']
+            return {
+                'jobs': dict(self.jobs),
+                'bytes_downloaded': self.bytes_downloaded,
+                'bytes_written': self.bytes_written,
+                'avg_throughput': self.bytes_downloaded / transfer if transfer else None,
+                'peak_throughput': self.peak_throughput,
+                'means': {key: self.sums[key] / self.counts[key] for key, _, _ in METRIC_TIMINGS if self.counts[key]},
+                'recent': list(self.recent),
+            }
+
+    def prometheus_text(self):
+        lines = ["# HELP avdl_jobs_total Download jobs finished this session, by outcome.", "# TYPE avdl_jobs_total counter"]
+        lines += [f'avdl_jobs_total{{status="{status}"}} {count}' for status, count in sorted(self.jobs.items())]
+        for name, kind, value, description in (
+                ('avdl_downloaded_bytes_total', 'counter', self.bytes_downloaded, "Bytes received from servers."),
+                ('avdl_written_bytes_total', 'counter', self.bytes_written, "Size of the finished files."),
+                ('avdl_peak_throughput_bytes', 'gauge', self.peak_throughput, "Highest speed reported by a single job.")):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        for key, name, description in METRIC_TIMINGS:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} summary",
+                      f"{name}_sum {self.sums[key]:.3f}", f"{name}_count {self.counts[key]}"]
+        return "\n".join(lines) + "\n"
+
+# --- DOWNLOAD ENGINE ---
+
+def resolve_format_selection(video_info):
+    format_text = video_info.get('selected_format_text', '')
+    if "Audio" in format_text:
+        video_info['selected_format_type'] = 'audio'
+        video_info['selected_format_ext'] = 'mp3' if 'MP3' in format_text else 'm4a'
+        return 'bestaudio/best'
+    height = (video_info.get('selected_quality') or '720p')[:-1]
+    video_info['selected_format_type'] = 'video'
+    video_info['selected_format_ext'] = 'mkv' if 'MKV' in format_text else 'mp4'
+    return f'bestvideo[height<={height}]+bestaudio/best'
+
+def archive_key(video_info):
+    id_key = video_id_key(video_info)
+    if not id_key:
+        return None
+    return f"{id_key}|{video_info.get('selected_format_text')}|{video_info.get('selected_quality')}"
+
+def find_partial_files(directory):
+    try:
+        with os.scandir(directory) as entries:
+            return [entry.path for entry in entries if entry.is_file() and
+                    (entry.name.endswith(PARTIAL_FILE_SUFFIXES) or '.part-Frag' in entry.name)]
+    except OSError:
+        return []
+
+def remove_files(paths):
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+def make_history_item(video_info):
+    return {
+        'title': video_info.get('title', 'N/A'),
+        'url': video_info.get('webpage_url', 'N/A'),
+        'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+class DownloadJob:
+    def __init__(self, video_info, format_selection, output_path, filename_template, rate_limit, on_postprocessing=None,
+                 cancel_event=None, pause_event=None, bandwidth=None, fragments=None, connections=1):
+        self.video_info = video_info
+        self.format_selection = format_selection
+        self.output_path = output_path
+        self.filename_template = filename_template
+        self.rate_limit = rate_limit
+        self.on_postprocessing = on_postprocessing
+        # Checked by the yt-dlp hooks, so a job stops at its next progress update instead of being killed mid-write
+        self.cancel_event = cancel_event or threading.Event()
+        self.pause_event = pause_event or threading.Event()
+        # Replaced wholesale by progress_hook and polled by the frontend, so only the latest value is ever shown
+        self.latest_progress = None
+        self.written_files = set()
+        # yt-dlp keeps the fragment downloader's resume state in "<final name>.ytdl", not next to the .part file
+        self.fragment_state_files = set()
+        # With a shared BandwidthManager the job throttles itself in progress_hook instead of using yt-dlp's ratelimit
+        self.bandwidth = bandwidth
+        self.bandwidth_id = None
+        self.counted_bytes = {}
+        self.fragment_tuner = fragments
+        self.fragment_workers = 1
+        self.fragment_count = 0
+        self.throttled = False
+        self.logger = YtdlpLogger()
+        self.connections = connections
+        # download() leaves yt-dlp's post-processing here so it can run on a separate pool
+        self.ydl = None
+        self.deferred = []
+        self.metrics = JobMetrics(video_info.get('metadata_seconds'))
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def pause(self):
+        self.pause_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def paused(self):
+        return self.pause_event.is_set() and not self.cancel_event.is_set()
+
+    def check_interrupted(self):
+        if self.cancel_event.is_set() or self.pause_event.is_set():
+            raise load_yt_dlp().utils.DownloadCancelled("Cancelled" if self.cancel_event.is_set() else "Paused")
+
+    def remove_partial_files(self):
+        # Fragment files are named after the .part file, e.g. "video.f137.mp4.part-Frag12"
+        paths = set()
+        for path in self.written_files:
+            paths.update(glob.glob(glob.escape(path) + '*'))
+        paths.update(path for path in self.fragment_state_files if os.path.exists(path))
+        return remove_files(paths)
+
+    def remove_fragment_leftovers(self):
+        # After a resumed download, fragments from the paused run (e.g. "video.ts.part-Frag12.part") can outlive the merge
+        paths = {path for path in self.fragment_state_files if os.path.exists(path)}
+        for path in self.written_files:
+            paths.update(glob.glob(glob.escape(path) + '-Frag*'))
+        return remove_files(paths)
+
+    def reusable_info(self):
+        # Cached info only keeps strip_info() fields (no format URLs, no extraction time), so it cannot be downloaded from
+        info = self.video_info
+        formats = info.get('formats')
+        if not formats or not all(f.get('url') for f in formats) or time.time() - info.get('epoch', 0) > INFO_REUSE_MAX_AGE:
+            return None
+        # The same clean-up yt-dlp applies to --load-info-json, so the format is selected again with this job's options
+        return load_yt_dlp().YoutubeDL.sanitize_info(info, remove_private_keys=True)
+
+    def build_ydl_options(self):
+        ydl_opts = {
+            'progress_hooks': [self.progress_hook],
+            'outtmpl': os.path.join(self.output_path, self.filename_template),
+            'noplaylist': True,
+            'ignoreerrors': True,
+            # Keep .part files and continue them, so re-queued items don't fetch completed bytes again
+            'continuedl': True,
+            'nopart': False,
+            'format': self.format_selection,
+            'socket_timeout': DOWNLOAD_SOCKET_TIMEOUT,
+            'concurrent_fragment_downloads': self.fragment_workers,
+            'logger': self.logger,
+            'postprocessor_hooks': [self.postprocessor_hook],
+            'postprocessors': [],
+        }
+        if self.rate_limit and self.bandwidth is None:
+            ydl_opts['ratelimit'] = parse_rate(self.rate_limit)
+
+        if self.video_info.get('selected_format_type') == 'audio':
+            ydl_opts.update({
+                'postprocessors': [
+                    {'key': 'FFmpegExtractAudio', 'preferredcodec': self.video_info.get('selected_format_ext'), 'preferredquality': '192'},
+                    {'key': 'EmbedThumbnail'},
+                    {'key': 'FFmpegMetadata', 'add_metadata': True},
+                ]
+            })
+        else:
+            ydl_opts['merge_output_format'] = self.video_info.get('selected_format_ext')
+        return ydl_opts
+
+    def run(self):
+        success, message = self.download()
+        if success:
+            success, message = self.postprocess()
+        return success, message
+
+    def failure(self, error):
+        if self.cancelled:
+            self.remove_partial_files()
+            return False, "Cancelled"
+        if self.paused:
+            return False, "Paused"
+        return False, f"Error: {error}"
+
+    def close(self):
+        if self.ydl is not None:
+            self.ydl.close()
+            self.ydl = None
+
+    def download(self):
+        if self.bandwidth is not None:
+            self.bandwidth_id = self.bandwidth.register()
+        self.metrics.download_started = time.monotonic()
+        try:
+            self.check_interrupted()
+            self.ydl = ydl = load_yt_dlp().YoutubeDL(self.build_ydl_options())
+            default_dl = ydl.dl
+            ydl.dl = lambda name, info, subtitle=False, test=False: self.dispatch_dl(ydl, default_dl, name, info, subtitle, test)
+            # Merging, conversion and moving the file into place all happen in post_process; keep them for later.
+            # yt-dlp strips the fields shared with the parent info from its dict once process_info returns, so keep a copy
+            ydl.post_process = lambda filename, info, files_to_move=None: self.deferred.append((filename, dict(info), files_to_move)) or info
+            info = self.reusable_info()
+            if info is not None:
+                ydl.process_ie_result(info, download=True)
+            if not self.deferred:
+                # Only stripped info, or format URLs that stopped working: extract again
+                self.check_interrupted()
+                ydl.download([self.video_info['webpage_url']])
+            if not self.deferred:
+                self.close()
+                return False, f"Error: {self.logger.last_error or 'Nothing was downloaded.'}"
+            self.remove_fragment_leftovers()
+            return True, "Downloaded."
+        except Exception as e:
+            self.close()
+            return self.failure(e)
+        finally:
+            self.metrics.download_finished = time.monotonic()
+            if self.bandwidth is not None:
+                self.bandwidth.unregister(self.bandwidth_id)
+
+    def postprocess(self):
+        self.metrics.postprocess_started = time.monotonic()
+        try:
+            for filename, info, files_to_move in self.deferred:
+                self.check_interrupted()
+                if not info.get('title'):
+                    # Tagging and the final filename would silently lose the video's metadata
+                    raise ValueError("Deferred post-processing is missing the video's metadata.")
+                info = type(self.ydl).post_process(self.ydl, filename, info, files_to_move)
+                if info.get('filepath') and os.path.exists(info['filepath']):
+                    self.metrics.bytes_written += os.path.getsize(info['filepath'])
+            return True, "Download completed!"
+        except Exception as e:
+            return self.failure(e)
+        finally:
+            self.metrics.postprocess_finished = time.monotonic()
+            self.close()
+
+    def dispatch_dl(self, ydl, default_dl, name, info, subtitle=False, test=False):
+        self.metrics.on_extracted()
+        if self.fragment_tuner is not None and not (subtitle or test) and (info.get('protocol') or '').startswith(FRAGMENTED_PROTOCOLS):
+            return self.fragmented_dl(ydl, default_dl, name, info)
+        self.metrics.on_request()
+        if self.connections > 1:
+            return self.segmented_dl(ydl, default_dl, name, info, subtitle, test)
+        return default_dl(name, info, subtitle=subtitle, test=test)
+
+    def fragmented_dl(self, ydl, default_dl, name, info):
+        # Workers are taken per stream, right before it starts, so progressive files never hold fragment slots;
+        # yt-dlp's fragment downloader reads the count from ydl.params when it starts
+        host = urllib.parse.urlsplit(self.video_info.get('webpage_url') or '').hostname or ''
+        self.fragment_workers, held = self.fragment_tuner.acquire(host, self.check_interrupted)
+        ydl.params['concurrent_fragment_downloads'] = self.fragment_workers
+        # Waiting for a fragment slot is neither extraction nor time to first byte
+        self.metrics.on_request()
+        self.fragment_count = 0
+        started = time.monotonic()
+        bytes_before = sum(self.counted_bytes.values())
+        retries_before = self.logger.retries
+        feedback = {}
+        try:
+            result = default_dl(name, info)
+            # Only unthrottled streams say anything about how many fragment workers a host can take
+            if self.fragment_count and not self.throttled:
+                feedback = {'rate': (sum(self.counted_bytes.values()) - bytes_before) / max(time.monotonic() - started, 0.001),
+                            'errors': self.logger.retries - retries_before, 'fragments': self.fragment_count}
+            return result
+        finally:
+            self.fragment_tuner.release(host, held, **feedback)
+
+    def segmented_dl(self, ydl, default_dl, name, info, subtitle=False, test=False):
+        # Plain progressive files only; streams, merged requests and yt-dlp's own .part files keep the usual downloader
+        if (subtitle or test or info.get('protocol') not in ('http', 'https') or info.get('requested_formats')
+                or ydl.params.get('ratelimit') or os.path.exists(name + '.part') and not os.path.exists(name + '.part.segments')):
+            return default_dl(name, info, subtitle=subtitle, test=test)
+        headers = dict(info.get('http_headers') or {})
+        cookie = ydl.cookiejar.get_cookie_header(info['url'])
+        if cookie:
+            headers['Cookie'] = cookie
+        if not SegmentedDownload(info['url'], name, headers, self.connections, self.progress_hook).run():
+            return default_dl(name, info, subtitle=subtitle, test=test)
+        return True, True
+
+    def throttle(self, d):
+        # downloaded_bytes is cumulative per file; the first report of a resumed file only sets the baseline
+        key = d.get('tmpfilename') or d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        previous = self.counted_bytes.get(key)
+        self.counted_bytes[key] = downloaded
+        if self.bandwidth is None or previous is None or downloaded <= previous:
+            return
+        delay = self.bandwidth.consume(self.bandwidth_id, downloaded - previous)
+        while delay > 0 and not self.cancel_event.is_set() and not self.pause_event.is_set():
+            step = min(delay, 0.25)
+            self.cancel_event.wait(step)
+            delay -= step
+
+    def postprocessor_hook(self, d):
+        # Only checked between post-processors so an ffmpeg run is never cut off halfway
+        if d['status'] == 'started':
+            self.check_interrupted()
+            if self.on_postprocessing and d.get('postprocessor') != 'MoveFiles':
+                self.on_postprocessing(f"Post-processing: {d.get('postprocessor')}...")
+
+    def progress_hook(self, d):
+        if d.get('tmpfilename'):
+            self.written_files.add(d['tmpfilename'])
+            if d.get('filename'):
+                self.fragment_state_files.add(d['filename'] + '.ytdl')
+        elif d['status'] == 'finished' and d.get('elapsed') is not None:
+            # "elapsed" is only reported for files fetched in this run, never for ones already on disk
+            self.written_files.add(d['filename'])
+        self.check_interrupted()
+        if d['status'] == 'downloading':
+            allotted = self.bandwidth.allotted(self.bandwidth_id) if self.bandwidth is not None else None
+            self.throttled = self.throttled or allotted is not None
+            self.fragment_count = max(self.fragment_count, d.get('fragment_count') or 0)
+            self.metrics.on_progress(d.get('tmpfilename') or d.get('filename'), d.get('downloaded_bytes') or 0)
+            self.latest_progress = {
+                'downloaded_bytes': d.get('downloaded_bytes') or 0,
+                'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+                'speed': d.get('speed'),
+                'eta': d.get('eta'),
+                'allotted': allotted,
+                'fragment_workers': self.fragment_workers if d.get('fragment_count') else None,
+            }
+            self.throttle(d)
+
+class BatchDownloader:
+    def __init__(self, output_path, filename_template, rate_limit, max_workers=1, metadata_cache=None,
+                 history_store=None, refresh_rate=DEFAULT_PROGRESS_REFRESH_RATE, out=None,
+                 record_history=True, skip_downloaded=True, bandwidth=None, fragments=None, connections=1, metrics=None):
+        self.output_path = output_path
+        self.filename_template = filename_template
+        self.rate_limit = rate_limit
+        self.max_workers = max_workers
+        self.metadata_cache = metadata_cache
+        self.history_store = history_store
+        self.record_history = record_history
+        self.skip_downloaded = skip_downloaded and history_store is not None
+        self.bandwidth = bandwidth
+        self.fragments = fragments
+        self.connections = connections
+        self.metrics = metrics
+        self.refresh_rate = refresh_rate
+        self.out = out or sys.stdout
+        self.output_lock = threading.Lock()
+        # Downloads hand finished files to this pool so the next download can start while ffmpeg runs
+        self.postprocess_executor = ThreadPoolExecutor(max_workers=POSTPROCESS_WORKERS, thread_name_prefix="postprocess")
+        self.active_jobs = {}
+        self.job_ids = itertools.count(1)
+        # Set on Ctrl+C; jobs stop at their next progress update and keep their .part files for a later run
+        self.pause_event = threading.Event()
+        self.circuit_breaker = CircuitBreaker()
+        # URLs that could not be resolved never become items, but still count as failed downloads
+        self.expand_failures = 0
+        # Archive hits found while expanding never become items either; the ones found later return None like interrupted items
+        self.expand_skips = 0
+        self.download_skips = 0
+        self.skips_lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        with self.output_lock:
+            self.out.write(json.dumps({'event': event, **fields}, ensure_ascii=False) + "\n")
+            self.out.flush()
+
+    def expand(self, url, format_text, quality):
+        try:
+            info = extract_info_cached(url, {'extract_flat': 'in_playlist', 'quiet': True, 'skip_download': True}, self.metadata_cache)
+        except Exception as e:
+            self.expand_failures += 1
+            self.emit('error', url=url, message=str(e))
+            return []
+        if not info:
+            self.expand_failures += 1
+            self.emit('error', url=url, message="No information returned.")
+            return []
+        entries = [entry for entry in info['entries'] if entry] if info.get('entries') else [info]
+        items = [dict(entry, selected_format_text=format_text, selected_quality=quality)
+                 for entry in entries if not entry.get('is_live')]
+        archived = self.history_store.archived([archive_key(item) for item in items]) if self.skip_downloaded else set()
+        queued = []
+        for item in items:
+            url = item.get('webpage_url') or item.get('url')
+            if archive_key(item) in archived:
+                self.expand_skips += 1
+                self.emit('skipped', url=url, title=item.get('title'), message="Already downloaded")
+                continue
+            queued.append(item)
+            self.emit('queued', url=url, title=item.get('title'))
+        return queued
+
+    def download_item(self, item):
+        host = item_host(item)
+        for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+            wait = self.circuit_breaker.blocked_for(host)
+            if wait:
+                self.emit('waiting', host=host, seconds=round(wait))
+                if self.pause_event.wait(wait):
+                    return None
+            result, message = self.attempt_item(item)
+            if result is not False:
+                if isinstance(result, Future):
+                    self.circuit_breaker.record_success(host)
+                return result
+            self.circuit_breaker.record_failure(host, is_throttling_error(message))
+            if is_permanent_error(message) or attempt == RETRY_MAX_ATTEMPTS:
+                break
+            delay = retry_delay(attempt)
+            self.emit('retrying', url=item.get('webpage_url') or item.get('url'), title=item.get('title'),
+                      attempt=attempt, delay=round(delay, 1), message=message)
+            if self.pause_event.wait(delay):
+                return None
+        self.emit('finished', url=item.get('webpage_url') or item.get('url'), title=item.get('title'), success=False, message=message)
+        return False
+
+    def attempt_item(self, item):
+        # (Future, None) once downloaded, (None, None) when skipped or interrupted, (False, message) when it failed
+        job_id = next(self.job_ids)
+        url = item.get('webpage_url') or item.get('url')
+        if self.pause_event.is_set():
+            return None, None
+        job = None
+        try:
+            if 'formats' not in item:
+                started = time.monotonic()
+                info = extract_info_cached(url, {'quiet': True}, self.metadata_cache, video_id_key(item))
+                if not info:
+                    raise ValueError("No information returned.")
+                item.update(info)
+                item['metadata_seconds'] = time.monotonic() - started
+            if self.skip_downloaded and self.history_store.archived([archive_key(item)]):
+                with self.skips_lock:
+                    self.download_skips += 1
+                self.emit('skipped', url=url, title=item.get('title'), message="Already downloaded")
+                return None, None
+            format_selector = resolve_format_selection(item)
+            job = DownloadJob(item, format_selector, self.output_path, self.filename_template, self.rate_limit,
+                              on_postprocessing=lambda message: self.emit('postprocessing', id=job_id, title=item.get('title'), message=message),
+                              pause_event=self.pause_event, bandwidth=self.bandwidth, fragments=self.fragments,
+                              connections=self.connections)
+            self.active_jobs[job_id] = job
+            self.emit('started', id=job_id, url=url, title=item.get('title'))
+            success, message = job.download()
+            if success:
+                self.emit('downloaded', id=job_id, title=item.get('title'))
+                return self.postprocess_executor.submit(self.postprocess_item, job_id, url, item, job), None
+        except Exception as e:
+            message = str(e)
+        finally:
+            self.active_jobs.pop(job_id, None)
+        if self.pause_event.is_set():
+            self.emit('interrupted', id=job_id, url=url, title=item.get('title'))
+            return None, None
+        if job is not None and self.metrics:
+            self.metrics.record(item, 'failed', job.metrics, message)
+        return False, message
+
+    def postprocess_item(self, job_id, url, item, job):
+        success, message = job.postprocess()
+        if not success and self.pause_event.is_set():
+            self.emit('interrupted', id=job_id, url=url, title=item.get('title'))
+            return None
+        if success and self.history_store:
+            self.history_store.add_to_archive(archive_key(item))
+            if self.record_history:
+                self.history_store.append(make_history_item(item))
+        if self.metrics:
+            self.metrics.record(item, 'completed' if success else 'failed', job.metrics, message)
+        self.emit('finished', id=job_id, url=url, title=item.get('title'), success=success, message=message,
+                  metrics=job.metrics.summary())
+        return success
+
+    def report_progress(self, stop_event):
+        shown = {}
+        while not stop_event.wait(1 / self.refresh_rate):
+            for job_id, job in list(self.active_jobs.items()):
+                progress = job.latest_progress
+                if progress is not None and shown.get(job_id) is not progress:
+                    shown[job_id] = progress
+                    self.emit('progress', id=job_id, **progress)
+
+    def run(self, items):
+        stop_event = threading.Event()
+        reporter = threading.Thread(target=self.report_progress, args=(stop_event,), daemon=True)
+        reporter.start()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="download")
+        futures = [executor.submit(self.download_item, item) for item in items]
+        # A download's result is a Future when its post-processing was handed to the post-processing pool
+        collect = lambda: [result.result() if isinstance(result, Future) else result
+                           for result in (future.result() for future in futures)]
+        try:
+            results = collect()
+        except KeyboardInterrupt:
+            self.pause_event.set()
+            self.emit('stopping', active=len(self.active_jobs))
+            results = collect()
+        finally:
+            executor.shutdown()
+            self.postprocess_executor.shutdown()
+        stop_event.set()
+        reporter.join()
+        completed = results.count(True)
+        failed = results.count(False) + self.expand_failures
+        self.emit('summary', completed=completed, failed=failed, skipped=self.expand_skips + self.download_skips,
+                  interrupted=results.count(None) - self.download_skips)
+        return completed, failed
 
 # --- THREAD WORKERS ---
 
+def parse_entry_range(text):
+    # "100" lists the first 100 entries (the latest, for channels), "201-400" or "201-" a 1-based range; None lists everything
+    text = text.strip()
+    if not text:
+        return None
+    start, dash, end = text.partition('-')
+    try:
+        if not dash:
+            count = int(start)
+            if count < 1:
+                raise ValueError
+            return 0, count
+        start = int(start) if start.strip() else 1
+        end = int(end) if end.strip() else None
+    except ValueError:
+        raise ValueError(f"Invalid limit '{text}'. Use a count like 100 or a range like 201-400.") from None
+    if start < 1 or end is not None and end < start:
+        raise ValueError(f"Invalid limit '{text}'. Use a count like 100 or a range like 201-400.")
+    return start - 1, end
+
 class InfoFetcherThread(QThread):
     finished = pyqtSignal(dict)
     error = pyqtSignal(str)
+    # Streaming mode: the playlist's own fields first, then its entries page by page, then whether the listing was complete
+    playlist_started = pyqtSignal(dict)
+    entries_page = pyqtSignal(list)
+    playlist_finished = pyqtSignal(bool)
 
-    def __init__(self, url):
+    def __init__(self, url, flat=True, cache=None, stream=False, entry_range=None):
         super().__init__()
         self.url = url
+        self.flat = flat
+        self.cache = cache
+        self.stream = stream
+        self.entry_range = entry_range
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
 
     def run(self):
+        if self.stream:
+            try:
+                self.run_streaming()
+            except Exception as e:
+                self.error.emit(str(e))
+            return
         try:
-            ydl_opts = {'extract_flat': 'in_playlist', 'quiet': True, 'skip_download': True}
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(self.url, download=False)
+            ydl_opts = {'quiet': True, 'skip_download': True}
+            if self.flat:
+                ydl_opts['extract_flat'] = 'in_playlist'
+            info = extract_info_cached(self.url, ydl_opts, self.cache)
             self.finished.emit(info)
         except Exception as e:
             self.error.emit(str(e))
 
-class ThumbnailDownloaderThread(QThread):
-    finished = pyqtSignal(QPixmap)
+    def run_streaming(self):
+        start, stop = self.entry_range or (0, None)
+        with load_yt_dlp().YoutubeDL({'quiet': True, 'skip_download': True, 'extract_flat': 'in_playlist'}) as ydl:
+            info = self.cache.get(self.url) if self.cache else None
+            if info is None:
+                # Unprocessed, a playlist's entries are still a lazy generator or paged list that fetches pages as it is read
+                info = ydl.extract_info(self.url, download=False, process=False)
+                # Channel and user pages often redirect to their video tab first
+                while info and info.get('_type') in ('url', 'url_transparent'):
+                    info = ydl.extract_info(info['url'], download=False, ie_key=info.get('ie_key'), process=False)
+                if not info:
+                    raise ValueError("No information returned.")
+                if info.get('entries') is None:
+                    info = ydl.process_ie_result(info, download=False)
+                    if self.cache:
+                        self.cache.put(self.url, info)
+            if info.get('entries') is None:
+                self.finished.emit(info)
+                return
+
+            self.playlist_started.emit({k: v for k, v in info.items() if k != 'entries'})
+            entries = info['entries']
+            # Paged lists fetch only the pages that cover the range; generators have to be read up to its start
+            entries = entries.getslice(start, stop) if hasattr(entries, 'getslice') else itertools.islice(entries, start, stop)
+            listed, page, page_started = [], [], time.monotonic()
+            complete = True
+            for entry in entries:
+                if self.stop_event.is_set():
+                    complete = False
+                    break
+                if not entry:
+                    continue
+                page.append(strip_info(entry))
+                if len(page) >= PLAYLIST_PAGE_SIZE or time.monotonic() - page_started >= PLAYLIST_PAGE_INTERVAL:
+                    listed.extend(page)
+                    self.entries_page.emit(page)
+                    page, page_started = [], time.monotonic()
+            listed.extend(page)
+            if page:
+                self.entries_page.emit(page)
+            # Only a complete, unlimited listing stands in for the playlist in the cache
+            if complete and self.entry_range is None and self.cache and not self.cache.get(self.url):
+                self.cache.put(self.url, dict(info, entries=listed))
+            self.playlist_finished.emit(complete)
+
+class ThumbnailLoader(QObject):
+    loaded = pyqtSignal(str, QPixmap)
+    decoded = pyqtSignal(str, int, int, QImage)
 
-    def __init__(self, url):
+    def __init__(self, cache_dir, max_workers=THUMBNAIL_WORKERS):
         super().__init__()
-        self.url = url
+        self.cache_dir = cache_dir
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnail")
+        self.http = KeepAliveConnections(THUMBNAIL_TIMEOUT)
+        self.pixmaps = OrderedDict()
+        self.pending = set()
+        self.decoded.connect(self.on_decoded)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.executor.submit(self.prune_disk_cache)
 
-    def run(self):
+    def request(self, url, size):
+        key = (url, size.width(), size.height())
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+            return pixmap
+        if key not in self.pending:
+            self.pending.add(key)
+            self.executor.submit(self.load, url, size.width(), size.height())
+        return None
+
+    def load(self, url, width, height):
         try:
-            data = urllib.request.urlopen(self.url).read()
-            pixmap = QPixmap()
-            pixmap.loadFromData(data)
-            self.finished.emit(pixmap)
+            image = QImage()
+            image.loadFromData(self.read_bytes(url))
+            if not image.isNull():
+                image = image.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self.decoded.emit(url, width, height, image)
         except Exception as e:
             print(f"Could not load thumbnail: {e}")
-            self.finished.emit(QPixmap())
+            self.decoded.emit(url, width, height, QImage())
+
+    def on_decoded(self, url, width, height, image):
+        key = (url, width, height)
+        self.pending.discard(key)
+        if image.isNull():
+            return
+        pixmap = QPixmap.fromImage(image)
+        self.pixmaps[key] = pixmap
+        if len(self.pixmaps) > THUMBNAIL_MEMORY_CACHE_SIZE:
+            self.pixmaps.popitem(last=False)
+        self.loaded.emit(url, pixmap)
+
+    def read_bytes(self, url):
+        cache_path = os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest())
+        if os.path.exists(cache_path):
+            os.utime(cache_path)
+            with open(cache_path, 'rb') as f:
+                return f.read()
+        data = self.fetch_bytes(url)
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+        return data
+
+    def fetch_bytes(self, url, redirects=3):
+        response = self.http.request(url, {'User-Agent': 'Mozilla/5.0'})
+        try:
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            self.http.drop(url)
+            raise
+        if response.status in (301, 302, 303, 307, 308) and redirects:
+            return self.fetch_bytes(urllib.parse.urljoin(url, response.getheader('Location')), redirects - 1)
+        if response.status != 200:
+            raise IOError(f"HTTP {response.status} for {url}")
+        return data
+
+    def prune_disk_cache(self):
+        try:
+            files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+            files = sorted((os.stat(path).st_mtime, os.path.getsize(path), path) for path in files if os.path.isfile(path))
+            total_size = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total_size <= THUMBNAIL_DISK_CACHE_MAX_BYTES:
+                    break
+                os.remove(path)
+                total_size -= size
+        except OSError as e:
+            print(f"Could not prune thumbnail cache: {e}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+class MetadataPrefetcher(QObject):
+    ready = pyqtSignal(str)
+    completed = pyqtSignal(int, str, object, str)
+
+    def __init__(self, cache=None, max_workers=METADATA_PREFETCH_WORKERS):
+        super().__init__()
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metadata")
+        self.pending = {}
+        self.results = {}
+        self.generation = 0
+        self.completed.connect(self.on_completed)
+
+    def request(self, url, id_key=None):
+        if not url or url in self.pending or url in self.results:
+            return
+        self.pending[url] = self.executor.submit(self.fetch, self.generation, url, id_key)
+
+    def fetch(self, generation, url, id_key=None):
+        try:
+            started = time.monotonic()
+            # Flat, so a playlist URL queued as-is (e.g. through the local API) only lists its entries
+            info = extract_info_cached(url, {'quiet': True, 'extract_flat': 'in_playlist'}, self.cache, id_key)
+            if not info:
+                raise ValueError("No information returned.")
+            info['metadata_seconds'] = time.monotonic() - started
+            self.completed.emit(generation, url, info, "")
+        except Exception as e:
+            self.completed.emit(generation, url, None, str(e))
+
+    def on_completed(self, generation, url, info, error):
+        if generation != self.generation: # Result belongs to a queue that was stopped or cleared
+            return
+        self.pending.pop(url, None)
+        self.results[url] = (info, error)
+        self.ready.emit(url)
+
+    def take(self, url):
+        return self.results.pop(url, None)
+
+    def clear(self):
+        self.generation += 1
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.results.clear()
+
+    def shutdown(self):
+        self.clear()
+        self.executor.shutdown(wait=False)
+
+def parse_url_lines(lines):
+    # Plain lists and CSV files alike: the URL is the first field, blank lines, '#' comments and a CSV header are skipped
+    first = True
+    for row in csv.reader(lines, skipinitialspace=True):
+        field = row[0].strip() if row else ''
+        if field and not field.startswith('#'):
+            if not (first and field.lower() in URL_COLUMN_HEADERS):
+                yield field
+            first = False
+
+def read_url_file(path):
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        yield from parse_url_lines(f)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+class UrlImporter(QObject):
+    imported = pyqtSignal(list, list)
+    done = pyqtSignal()
+
+    def __init__(self, cache=None, max_workers=IMPORT_WORKERS):
+        super().__init__()
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="import")
+        # The feeder waits for a free slot before reading the next line, so a 10k-line file is never held in memory at once
+        self.slots = threading.BoundedSemaphore(max_workers * 2)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.cancel_event = threading.Event()
+        self.items = []
+        self.errors = []
+        self.pending = 0
+        self.read_count = 0
+        self.feeder_done = True
+        # Results are handed to the GUI in batches rather than one signal per URL
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(IMPORT_FLUSH_INTERVAL_MS)
+        self.flush_timer.timeout.connect(self.flush)
+
+    @property
+    def running(self):
+        return self.flush_timer.isActive()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def start(self, urls, format_text, quality):
+        if self.running:
+            return False
+        self.cancel_event.clear()
+        self.read_count = 0
+        self.feeder_done = False
+        threading.Thread(target=self.feed, args=(urls, format_text, quality), daemon=True).start()
+        self.flush_timer.start()
+        return True
+
+    def feed(self, urls, format_text, quality):
+        seen = set()
+        try:
+            for url in urls:
+                if self.cancel_event.is_set():
+                    break
+                key = normalize_url(url)
+                if key in seen:
+                    continue
+                seen.add(key)
+                self.slots.acquire()
+                with self.lock:
+                    self.pending += 1
+                    self.read_count += 1
+                self.executor.submit(self.resolve, url, format_text, quality)
+        except (OSError, RuntimeError, csv.Error) as e:
+            with self.lock:
+                self.errors.append((None, str(e)))
+        finally:
+            with self.lock:
+                self.feeder_done = True
+
+    def get_ydl(self):
+        # One YoutubeDL per worker thread; building one per URL would dominate a large import
+        if not hasattr(self.local, 'ydl'):
+            self.local.ydl = load_yt_dlp().YoutubeDL({'quiet': True, 'skip_download': True, 'extract_flat': 'in_playlist'})
+        return self.local.ydl
+
+    def resolve(self, url, format_text, quality):
+        try:
+            if self.cancel_event.is_set():
+                return
+            info = extract_info_cached(url, None, self.cache, ydl=self.get_ydl())
+            if not info:
+                raise ValueError("No information returned.")
+            entries = [entry for entry in info['entries'] if entry] if info.get('entries') else [info]
+            items = [dict(strip_info(entry), selected_format_text=format_text, selected_quality=quality)
+                     for entry in entries if not entry.get('is_live')]
+            with self.lock:
+                self.items.extend(items)
+        except Exception as e:
+            with self.lock:
+                self.errors.append((url, str(e)))
+        finally:
+            with self.lock:
+                self.pending -= 1
+            self.slots.release()
+
+    def flush(self):
+        with self.lock:
+            items, self.items = self.items, []
+            errors, self.errors = self.errors, []
+            finished = self.feeder_done and not self.pending
+        if not self.cancelled and (items or errors):
+            self.imported.emit(items, errors)
+        if finished:
+            self.flush_timer.stop()
+            self.done.emit()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
 
 class DownloaderThread(QThread):
-    progress = pyqtSignal(int)
-    stats = pyqtSignal(str, str)
     postprocessing = pyqtSignal(str)
     finished = pyqtSignal(bool, str, dict)
 
-    def __init__(self, video_info, format_selection, output_path, filename_template, rate_limit):
+    def __init__(self, video_info, format_selection, output_path, filename_template, rate_limit, bandwidth=None, fragments=None,
+                 connections=1):
         super().__init__()
         self.video_info = video_info
-        self.format_selection = format_selection
-        self.output_path = output_path
-        self.filename_template = filename_template
-        self.rate_limit = rate_limit
+        self.job = DownloadJob(video_info, format_selection, output_path, filename_template, rate_limit,
+                               on_postprocessing=self.postprocessing.emit, bandwidth=bandwidth, fragments=fragments,
+                               connections=connections)
+
+    @property
+    def latest_progress(self):
+        return self.job.latest_progress
 
     def run(self):
+        # Download stage only; post-processing is handed to PostProcessingQueue
+        success, message = self.job.download()
+        self.finished.emit(success, message, self.video_info)
+
+    def wait_detached(self):
+        # Called once a halted job finally reports back; by then run() is returning
+        self.wait()
+        self.deleteLater()
+
+
+class PostProcessingQueue(QObject):
+    finished = pyqtSignal(int, bool, str)
+
+    def __init__(self, max_workers=POSTPROCESS_WORKERS):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="postprocess")
+
+    def submit(self, job_id, job):
+        self.executor.submit(self.run, job_id, job)
+
+    def run(self, job_id, job):
+        success, message = job.postprocess()
+        self.finished.emit(job_id, success, message)
+
+    def shutdown(self):
+        # Waiting jobs are left in the queue journal and redone on the next launch
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+# --- LOCAL API ---
+
+class ApiRequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class LocalApiServer(QObject):
+    # A small HTTP/JSON server on an asyncio loop in its own thread. Requests are handed to the GUI thread in batches:
+    # the signal fires once per batch, however many requests arrive before the GUI gets to it
+    requests_ready = pyqtSignal()
+
+    def __init__(self, port, token, host=API_HOST):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.token = token
+        self.lock = threading.Lock()
+        self.pending = []
+        self.loop = None
+        self.stopping = None
+        self.thread = None
+
+    def start(self):
+        started = Future()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.serve(started)), name="local-api", daemon=True)
+        self.thread.start()
+        started.result(timeout=STOP_WAIT_SECONDS) # Raises the OSError if the port is taken
+
+    async def serve(self, started):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
         try:
-            ydl_opts = {
-                'progress_hooks': [self.progress_hook],
-                'outtmpl': os.path.join(self.output_path, self.filename_template),
-                'noplaylist': True,
-                'ignoreerrors': True,
-                'format': self.format_selection,
-                'postprocessors': [],
-            }
-            if self.rate_limit:
-                ydl_opts['ratelimit'] = self.rate_limit
-
-            if self.video_info.get('selected_format_type') == 'audio':
-                ydl_opts.update({
-                    'postprocessors': [
-                        {'key': 'FFmpegExtractAudio', 'preferredcodec': self.video_info.get('selected_format_ext'), 'preferredquality': '192'},
-                        {'key': 'EmbedThumbnail'},
-                        {'key': 'FFmpegMetadata', 'add_metadata': True},
-                    ]
-                })
-            else:
-                ydl_opts['merge_output_format'] = self.video_info.get('selected_format_ext')
+            server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        except OSError as e:
+            started.set_exception(e)
+            return
+        started.set_result(None)
+        await self.stopping.wait()
+        # Open keep-alive connections are cancelled when asyncio.run() returns
+        server.close()
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([self.video_info['webpage_url']])
+    def stop(self):
+        if self.thread is not None and self.thread.is_alive() and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+            self.thread.join(STOP_WAIT_SECONDS)
+        # Anything still waiting for the GUI gets an answer instead of a timeout
+        for _, _, _, future in self.take_requests():
+            future.set_result((503, {'error': "The server is shutting down."}))
 
-            self.finished.emit(True, "Download completed!", self.video_info)
+    def take_requests(self):
+        with self.lock:
+            requests, self.pending = self.pending, []
+        return requests
 
-        except Exception as e:
-            self.finished.emit(False, f"Error: {e}", self.video_info)
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise ApiRequestError(400, "Malformed request line.") from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= API_MAX_HEADERS:
+                raise ApiRequestError(431, "Too many headers.")
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise ApiRequestError(400, "Invalid Content-Length.") from None
+        if length > API_MAX_BODY:
+            raise ApiRequestError(413, "Request body too large.")
+        body = await reader.readexactly(length) if length > 0 else b''
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        return method.upper(), urllib.parse.urlsplit(target).path.rstrip('/') or '/', headers, body, keep_alive
 
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
-            if total_bytes:
-                downloaded_bytes = d.get('downloaded_bytes', 0)
-                percentage = int((downloaded_bytes / total_bytes) * 100)
-                self.progress.emit(percentage)
-            self.stats.emit(d.get('_speed_str', 'N/A'), d.get('_eta_str', 'N/A'))
-        elif d['status'] == 'finished':
-            self.postprocessing.emit("Post-processing (merging, converting)...")
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body, keep_alive = request
+                    status, payload = await self.dispatch(method, path, headers, body)
+                except ApiRequestError as e:
+                    status, payload, keep_alive = e.status, {'error': str(e)}, False
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                             .encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, headers, body):
+        # Only local programs that were given the token (shown in Settings) may use the API
+        if not hmac.compare_digest(headers.get('authorization', '').encode('latin-1'), f"Bearer {self.token}".encode('latin-1')):
+            return 401, {'error': "Missing or wrong token."}
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            raise ApiRequestError(400, "The body is not valid JSON.") from None
+        if not isinstance(data, dict):
+            raise ApiRequestError(400, "The body must be a JSON object.")
+        future = Future()
+        with self.lock:
+            notify = not self.pending
+            self.pending.append((method, path, data, future))
+        if notify:
+            self.requests_ready.emit()
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), API_REPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            return 503, {'error': "The application did not respond in time."}
+
+# --- MODELS ---
+
+class HistoryTableModel(QAbstractTableModel):
+    HEADERS = ["Title", "URL", "Date"]
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.rows = []
+        self.exhausted = False
+        self.filters = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.rows[index.row()][index.column() + 1]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        before_id = self.rows[-1][0] if self.rows else None
+        try:
+            page = self.store.page(before_id, **self.filters)
+        except sqlite3.Error as e:
+            print(f"Could not read history store: {e}")
+            page = []
+        self.exhausted = len(page) < HISTORY_PAGE_SIZE
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    def set_filter(self, text='', date_from='', date_to=''):
+        self.beginResetModel()
+        self.filters = {'text': text, 'date_from': date_from, 'date_to': date_to}
+        self.rows = []
+        self.exhausted = False
+        self.endResetModel()
+
+    def prepend(self, row_id, item):
+        if row_id is None or any(self.filters.values()):
+            return
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.rows.insert(0, (row_id, item.get('title'), item.get('url'), item.get('date')))
+        self.endInsertRows()
+
+    def url_at(self, row):
+        return self.rows[row][2]
+
+class PlaylistModel(QAbstractListModel):
+    selection_changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.items = []
+        self.checked = set()
+        # Estimated size per row; the total for checked rows is kept up to date as rows are (un)checked
+        self.sizes = []
+        self.selected_size = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+
+    def row_size(self, row):
+        return self.sizes[row] if row < len(self.sizes) else 0
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return f"{row + 1}. {self.items[row].get('title', 'Untitled')}"
+        if role in (Qt.ToolTipRole, Qt.UserRole):
+            return self.items[row].get('title', 'Untitled')
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if row in self.checked else Qt.Unchecked
+        return None
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        row = index.row()
+        if value == Qt.Checked and row not in self.checked:
+            self.checked.add(row)
+            self.selected_size += self.row_size(row)
+        elif value != Qt.Checked and row in self.checked:
+            self.checked.discard(row)
+            self.selected_size -= self.row_size(row)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        self.selection_changed.emit()
+        return True
+
+    def set_items(self, items, checked=True):
+        self.beginResetModel()
+        self.items = items
+        self.checked = set(range(len(items))) if checked else set()
+        self.sizes = []
+        self.selected_size = 0
+        self.endResetModel()
+        self.selection_changed.emit()
+
+    def append_items(self, items, checked=True):
+        if not items:
+            return
+        first_row = len(self.items)
+        self.beginInsertRows(QModelIndex(), first_row, first_row + len(items) - 1)
+        self.items.extend(items)
+        if checked:
+            self.checked.update(range(first_row, first_row + len(items)))
+        self.endInsertRows()
+        self.selection_changed.emit()
+
+    def set_sizes(self, sizes):
+        self.sizes = sizes
+        self.selected_size = sum(self.row_size(row) for row in self.checked)
+        self.selection_changed.emit()
+
+    def set_checked(self, rows, checked=True):
+        rows = list(rows)
+        if not rows:
+            return
+        if checked:
+            changed = set(rows) - self.checked
+            self.checked.update(changed)
+            self.selected_size += sum(self.row_size(row) for row in changed)
+        else:
+            changed = self.checked.intersection(rows)
+            self.checked.difference_update(changed)
+            self.selected_size -= sum(self.row_size(row) for row in changed)
+        self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)), [Qt.CheckStateRole])
+        self.selection_changed.emit()
+
+    def check_only(self, rows):
+        self.set_checked(list(self.checked), False)
+        self.set_checked(rows, True)
+
+    def selected_items(self):
+        return [self.items[row] for row in sorted(self.checked)]
+
+# --- WIDGETS ---
+
+class DownloadJobWidget(QWidget):
+    def __init__(self, title, parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.title_label = QLabel(title)
+        self.title_label.setFixedWidth(220)
+        self.title_label.setToolTip(title)
+        layout.addWidget(self.title_label)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setTextVisible(True)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        layout.addWidget(self.progress_bar, 1)
+        self.speed_label = QLabel("Speed: N/A")
+        layout.addWidget(self.speed_label)
+        self.eta_label = QLabel("ETA: N/A")
+        layout.addWidget(self.eta_label)
+        self.pause_button = QPushButton("Pause")
+        self.pause_button.setFixedWidth(80)
+        layout.addWidget(self.pause_button)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setFixedWidth(80)
+        layout.addWidget(self.cancel_button)
+        self.shown_progress = None
+        self.speed = 0
+
+    def update_progress(self, progress):
+        if progress is None or progress is self.shown_progress or self.progress_bar.maximum() == 0:
+            return
+        self.shown_progress = progress
+        if progress['total_bytes']:
+            self.progress_bar.setValue(int(progress['downloaded_bytes'] / progress['total_bytes'] * 100))
+        self.speed = progress['speed'] or 0
+        if progress.get('allotted'):
+            self.speed_label.setText(f"Speed: {format_speed(progress['speed'])} of {format_speed(progress['allotted'])}")
+        else:
+            self.speed_label.setText(f"Speed: {format_speed(progress['speed'])}")
+        self.eta_label.setText(f"ETA: {format_eta(progress['eta'])}")
+        if progress.get('fragment_workers'):
+            self.speed_label.setToolTip(f"{progress['fragment_workers']} concurrent fragment(s)")
+
+    def on_postprocessing(self, message):
+        self.speed = 0
+        self.progress_bar.setRange(0, 0)
+        self.speed_label.setText(message)
+        self.eta_label.setText("")
+
+    def set_paused(self, paused):
+        self.speed = 0
+        self.shown_progress = None
+        self.pause_button.setEnabled(True)
+        self.pause_button.setText("Resume" if paused else "Pause")
+        self.speed_label.setText("Paused" if paused else "Resuming...")
+        self.eta_label.setText("")
+        if not paused:
+            self.progress_bar.setRange(0, 100)
 
 
 class VideoDownloader(QWidget):
     def __init__(self):
         super().__init__()
-        self.settings = QSettings("AreaVII", "VideoDownloader")
+        self.settings = open_settings()
         self.fetched_info = None
         self.playlist_items = []
         self.download_queue = []
         self.is_downloading = False
-        self.history_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json")
+        self.is_direct_download = False
+        self.is_fetching_info = False
+        self.playlist_loading = False
+        self.probe_pending = False
+        self.playlist_complete = True
+        self.info_thread = None
+        self.probe_thread = None
+        self.retired_threads = []
+        self.active_downloads = {}
+        self.paused_downloads = {}
+        self.postprocessing_jobs = {}
+        self.halted_threads = set()
+        self.job_ids = itertools.count(1)
+        self.queue_total = 0
+        self.queue_completed = 0
+        self.skipped_count = 0
+        self.progress_timer = QTimer(self)
+        self.progress_timer.timeout.connect(self.refresh_download_progress)
+        # Wakes the queue when the earliest delayed retry or blocked host becomes ready
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.process_download_queue)
+        self.circuit_breaker = CircuitBreaker()
+        self.failed_count = 0
+        self.history_store = HistoryStore(os.path.join(APP_DIR, "history.sqlite3"), legacy_json_path=os.path.join(APP_DIR, "history.json"))
+        self.metadata_cache = MetadataCache(os.path.join(APP_DIR, "metadata_cache.sqlite3"))
+        self.queue_store = QueueStore(os.path.join(APP_DIR, "queue.sqlite3"))
+        self.download_queue = self.queue_store.pending()
+        self.metadata_prefetcher = MetadataPrefetcher(self.metadata_cache)
+        self.metadata_prefetcher.ready.connect(self.on_metadata_ready)
+        self.url_importer = UrlImporter(self.metadata_cache)
+        self.url_importer.imported.connect(self.on_urls_imported)
+        self.url_importer.done.connect(self.on_url_import_done)
+        self.import_counts = {}
+        self.thumbnail_loader = ThumbnailLoader(os.path.join(APP_DIR, "thumbnails"))
+        self.thumbnail_loader.loaded.connect(self.on_thumbnail_loaded)
+        self.thumbnail_url = None
+        self.format_index = None
+        self.format_indexes = {}
+        self.bandwidth = BandwidthManager()
+        self.fragment_tuner = FragmentTuner()
+        self.postprocessing_queue = PostProcessingQueue()
+        self.postprocessing_queue.finished.connect(self.on_postprocessing_finished)
+        self.metrics = MetricsRecorder(os.path.join(APP_DIR, "metrics.jsonl"), os.path.join(APP_DIR, "metrics.prom"))
+        self.api_server = None
+        # How recently finished queue items ended, so API clients can still ask about them
+        self.api_results = OrderedDict()
+
+        mark_startup("stores and workers")
 
         self.load_settings()
         self.initUI()
-        self.load_history()
+        mark_startup("main window")
+        if self.download_queue:
+            self.status_label.setText(f"Restored {len(self.download_queue)} queued item(s) from the last session.")
+        self.apply_api_settings()
 
         self.setAcceptDrops(True)
 
@@ -183,7 +2532,7 @@ class VideoDownloader(QWidget):
                 background-color: #282b30; 
                 color: #72767d; 
             }
-            QLineEdit, QComboBox, QTableWidget { 
+            QLineEdit, QComboBox, QTableWidget, QTableView, QListView { 
                 padding: 8px; 
                 margin: 5px; 
                 border: 1px solid #43b581;
@@ -223,6 +2572,7 @@ class VideoDownloader(QWidget):
         self.queue_tab = QWidget()
         self.history_tab = QWidget()
         self.settings_tab = QWidget()
+        self.stats_tab = QWidget()
 
         self.tab_bar = QTabBar()
         self.tab_bar.setExpanding(False)
@@ -232,11 +2582,13 @@ class VideoDownloader(QWidget):
         queue_icon = self.style().standardIcon(QStyle.SP_FileDialogListView)
         history_icon = self.style().standardIcon(QStyle.SP_FileDialogDetailedView)
         settings_icon = self.style().standardIcon(QStyle.SP_ToolBarHorizontalExtensionButton)
+        stats_icon = self.style().standardIcon(QStyle.SP_FileDialogInfoView)
 
         self.tab_bar.addTab(download_icon, "Downloader")
         self.tab_bar.addTab(queue_icon, "Download Queue")
         self.tab_bar.addTab(history_icon, "History")
         self.tab_bar.addTab(settings_icon, "Settings")
+        self.tab_bar.addTab(stats_icon, "Stats")
         self.tab_bar.setIconSize(QSize(20, 20))
         
         self.stacked_widget = QStackedWidget()
@@ -244,13 +2596,17 @@ class VideoDownloader(QWidget):
         self.stacked_widget.addWidget(self.queue_tab)
         self.stacked_widget.addWidget(self.history_tab)
         self.stacked_widget.addWidget(self.settings_tab)
+        self.stacked_widget.addWidget(self.stats_tab)
         
-        self.tab_bar.currentChanged.connect(self.stacked_widget.setCurrentIndex)
+        self.tab_bar.currentChanged.connect(self.show_tab)
         
         self.init_downloader_tab()
-        self.init_queue_tab()
-        self.init_history_tab()
-        self.init_settings_tab()
+        # The other tabs are built the first time they are shown
+        self.queue_table = None
+        self.history_model = None
+        self.path_edit = None
+        self.stats_table = None
+        self.tab_builders = {1: self.init_queue_tab, 2: self.init_history_tab, 3: self.init_settings_tab, 4: self.init_stats_tab}
         
         tab_bar_layout = QHBoxLayout()
         tab_bar_layout.addStretch()
@@ -262,12 +2618,8 @@ class VideoDownloader(QWidget):
 
         progress_group = QGroupBox("Current Download")
         progress_layout = QVBoxLayout()
-        stats_layout = QHBoxLayout()
-        self.speed_label = QLabel("Speed: N/A")
-        stats_layout.addWidget(self.speed_label)
-        self.eta_label = QLabel("ETA: N/A")
-        stats_layout.addWidget(self.eta_label)
-        progress_layout.addLayout(stats_layout)
+        self.jobs_layout = QVBoxLayout()
+        progress_layout.addLayout(self.jobs_layout)
         self.progress_bar = QProgressBar()
         self.progress_bar.setTextVisible(True)
         progress_layout.addWidget(self.progress_bar)
@@ -289,6 +2641,17 @@ class VideoDownloader(QWidget):
         progress_group.setLayout(progress_layout)
         main_layout.addWidget(progress_group)
 
+    def show_tab(self, index):
+        self.ensure_tab_built(index)
+        self.stacked_widget.setCurrentIndex(index)
+        if index == 4:
+            self.refresh_stats_view()
+
+    def ensure_tab_built(self, index):
+        builder = self.tab_builders.pop(index, None)
+        if builder:
+            builder()
+
     def init_downloader_tab(self):
         layout = QVBoxLayout(self.downloader_tab)
         layout.setContentsMargins(0,0,0,0)
@@ -304,6 +2667,12 @@ class VideoDownloader(QWidget):
         self.url_input = QLineEdit()
         self.url_input.setPlaceholderText("Enter or Drop Video/Playlist URL here")
         input_layout.addWidget(self.url_input)
+        self.playlist_limit_edit = QLineEdit()
+        self.playlist_limit_edit.setPlaceholderText("Limit, e.g. 100")
+        self.playlist_limit_edit.setToolTip("Only list part of a playlist or channel: '100' for the first (latest) 100 entries, "
+                                            "'201-400' for a range. Leave empty to list everything.")
+        self.playlist_limit_edit.setFixedWidth(150)
+        input_layout.addWidget(self.playlist_limit_edit)
         self.fetch_button = QPushButton("Fetch Info")
         self.fetch_button.clicked.connect(self.fetch_video_info)
         input_layout.addWidget(self.fetch_button)
@@ -314,7 +2683,7 @@ class VideoDownloader(QWidget):
         options_layout = QGridLayout()
         options_layout.addWidget(QLabel("Format:"), 0, 0)
         self.format_combo = QComboBox()
-        self.format_combo.addItems(["Video (MP4)", "Video (MKV)", "Audio (MP3)", "Audio (M4A)"])
+        self.format_combo.addItems(FORMAT_CHOICES)
         self.format_combo.currentIndexChanged.connect(self.toggle_resolution_box)
         options_layout.addWidget(self.format_combo, 0, 1)
         self.resolution_label = QLabel("Quality:")
@@ -351,14 +2720,44 @@ class VideoDownloader(QWidget):
         info_group_widget.setLayout(info_main_layout)
         outer_info_layout = QVBoxLayout()
         outer_info_layout.addWidget(info_group_widget)
-        self.playlist_scroll_area = QScrollArea()
-        self.playlist_scroll_area.setWidgetResizable(True)
-        self.playlist_view_widget = QWidget()
-        self.video_list_layout = QVBoxLayout(self.playlist_view_widget)
-        self.video_list_layout.setAlignment(Qt.AlignTop)
-        self.playlist_scroll_area.setWidget(self.playlist_view_widget)
-        self.playlist_scroll_area.setVisible(False)
-        outer_info_layout.addWidget(self.playlist_scroll_area)
+        self.playlist_panel = QWidget()
+        playlist_layout = QVBoxLayout(self.playlist_panel)
+        playlist_layout.setContentsMargins(0, 0, 0, 0)
+        playlist_controls = QHBoxLayout()
+        self.playlist_filter_edit = QLineEdit()
+        self.playlist_filter_edit.setPlaceholderText("Filter by title")
+        playlist_controls.addWidget(self.playlist_filter_edit, 1)
+        select_all_button = QPushButton("All")
+        select_all_button.clicked.connect(lambda: self.set_visible_playlist_items_checked(True))
+        playlist_controls.addWidget(select_all_button)
+        select_none_button = QPushButton("None")
+        select_none_button.clicked.connect(lambda: self.set_visible_playlist_items_checked(False))
+        playlist_controls.addWidget(select_none_button)
+        self.playlist_range_edit = QLineEdit()
+        self.playlist_range_edit.setPlaceholderText("Range, e.g. 1-50, 80")
+        self.playlist_range_edit.returnPressed.connect(self.select_playlist_range)
+        playlist_controls.addWidget(self.playlist_range_edit)
+        select_range_button = QPushButton("Select Range")
+        select_range_button.clicked.connect(self.select_playlist_range)
+        playlist_controls.addWidget(select_range_button)
+        playlist_layout.addLayout(playlist_controls)
+
+        self.playlist_model = PlaylistModel(self)
+        self.playlist_model.selection_changed.connect(self.update_playlist_selection_label)
+        self.playlist_model.selection_changed.connect(self.show_selected_size)
+        self.playlist_proxy = QSortFilterProxyModel(self)
+        self.playlist_proxy.setSourceModel(self.playlist_model)
+        self.playlist_proxy.setFilterRole(Qt.UserRole)
+        self.playlist_proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.playlist_filter_edit.textChanged.connect(self.playlist_proxy.setFilterFixedString)
+        self.playlist_view = QListView()
+        self.playlist_view.setModel(self.playlist_proxy)
+        self.playlist_view.setUniformItemSizes(True)
+        playlist_layout.addWidget(self.playlist_view)
+        self.playlist_selection_label = QLabel()
+        playlist_layout.addWidget(self.playlist_selection_label)
+        self.playlist_panel.setVisible(False)
+        outer_info_layout.addWidget(self.playlist_panel)
         info_group.setLayout(outer_info_layout)
         layout.addWidget(info_group)
 
@@ -387,7 +2786,22 @@ class VideoDownloader(QWidget):
         self.queue_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
         self.queue_table.verticalHeader().setVisible(False)
         layout.addWidget(self.queue_table)
+        self.queue_skipped_label = QLabel()
+        layout.addWidget(self.queue_skipped_label)
+        self.update_queue_skipped_label()
+        self.import_status_label = QLabel()
+        self.import_status_label.setVisible(False)
+        layout.addWidget(self.import_status_label)
         queue_controls = QHBoxLayout()
+        import_file_button = QPushButton("Import URLs...")
+        import_file_button.setToolTip("Add every URL in a text or CSV file (one per line, first column)")
+        import_file_button.clicked.connect(self.import_url_file)
+        paste_urls_button = QPushButton("Paste URLs")
+        paste_urls_button.setToolTip("Add every URL on the clipboard")
+        paste_urls_button.clicked.connect(self.import_clipboard_urls)
+        queue_controls.addWidget(import_file_button)
+        queue_controls.addWidget(paste_urls_button)
+        queue_controls.addStretch(1)
         self.start_queue_button = QPushButton("Start Queue Download")
         self.start_queue_button.clicked.connect(self.start_queue_download)
         self.clear_queue_button = QPushButton("Clear Queue")
@@ -396,15 +2810,187 @@ class VideoDownloader(QWidget):
         queue_controls.addWidget(self.clear_queue_button)
         layout.addLayout(queue_controls)
 
+        layout.addWidget(QLabel("Failed:"))
+        self.failed_table = QTableWidget()
+        self.failed_table.setColumnCount(3)
+        self.failed_table.setHorizontalHeaderLabels(["Title", "Attempts", "Reason"])
+        self.failed_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.failed_table.verticalHeader().setVisible(False)
+        self.failed_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.failed_table)
+        failed_controls = QHBoxLayout()
+        self.retry_failed_button = QPushButton("Retry Failed")
+        self.retry_failed_button.clicked.connect(self.retry_failed_items)
+        self.clear_failed_button = QPushButton("Clear Failed")
+        self.clear_failed_button.clicked.connect(self.clear_failed_items)
+        failed_controls.addWidget(self.retry_failed_button)
+        failed_controls.addWidget(self.clear_failed_button)
+        layout.addLayout(failed_controls)
+
+        self.start_queue_button.setEnabled(not self.is_downloading)
+        self.clear_queue_button.setEnabled(not self.is_downloading)
+        self.retry_failed_button.setEnabled(not self.is_downloading)
+        self.populate_queue_table()
+        self.populate_failed_table()
+
+    def update_queue_skipped_label(self):
+        if self.queue_table is not None:
+            self.queue_skipped_label.setText(f"Skipped as already downloaded: {self.skipped_count}")
+            self.queue_skipped_label.setVisible(self.skipped_count > 0)
+
+    def skip_downloaded_items(self, items):
+        if not self.skip_downloaded:
+            return items
+        keys = [archive_key(item) for item in items]
+        archived = self.history_store.archived(keys)
+        kept = [item for item, key in zip(items, keys) if key not in archived]
+        self.skipped_count += len(items) - len(kept)
+        self.update_queue_skipped_label()
+        return kept
+
+    def populate_queue_table(self):
+        self.queue_table.setRowCount(0)
+        if self.is_direct_download and self.is_downloading:
+            return
+        self.add_queue_rows(self.download_queue)
+
+    def populate_failed_table(self):
+        if self.queue_table is None:
+            return
+        failed = self.queue_store.failed()
+        self.failed_table.setRowCount(len(failed))
+        for row, item in enumerate(failed):
+            self.failed_table.setItem(row, 0, QTableWidgetItem(item.get('title', 'N/A')))
+            self.failed_table.setItem(row, 1, QTableWidgetItem(str(item.get('retry_attempts', 0) + 1)))
+            reason = QTableWidgetItem(item.get('failure') or '')
+            reason.setToolTip(item.get('failure') or '')
+            self.failed_table.setItem(row, 2, reason)
+
+    def retry_failed_items(self):
+        if self.is_downloading:
+            return
+        count = self.queue_store.retry_failed()
+        self.circuit_breaker.reset()
+        self.restore_queue_from_store()
+        self.populate_failed_table()
+        self.status_label.setText(f"Re-queued {count} failed item(s).")
+
+    def clear_failed_items(self):
+        self.queue_store.clear_failed()
+        self.populate_failed_table()
+
+    def add_queue_row(self, item):
+        self.add_queue_rows([item])
+
+    def add_queue_rows(self, items, first_row=None):
+        # One resize and one repaint for the whole batch instead of an insertRow per item
+        if not items:
+            return
+        self.queue_table.setUpdatesEnabled(False)
+        if first_row is None:
+            first_row = self.queue_table.rowCount()
+            self.queue_table.setRowCount(first_row + len(items))
+        else:
+            for row in range(first_row, first_row + len(items)):
+                self.queue_table.insertRow(row)
+        for row, item in enumerate(items, first_row):
+            self.queue_table.setItem(row, 0, QTableWidgetItem(item.get('title') or item.get('url') or 'N/A'))
+            self.queue_table.setItem(row, 1, QTableWidgetItem(item.get('selected_quality')))
+            self.queue_table.setItem(row, 2, QTableWidgetItem(item.get('selected_format_text')))
+        self.queue_table.setUpdatesEnabled(True)
+
+    def import_url_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import URLs", "", "URL lists (*.txt *.csv);;All files (*)")
+        if path:
+            self.import_urls(read_url_file(path), os.path.basename(path))
+
+    def import_clipboard_urls(self):
+        urls = list(parse_url_lines(QApplication.clipboard().text().splitlines()))
+        if not urls:
+            self.status_label.setText("The clipboard has no URLs.")
+            return
+        self.import_urls(urls, "the clipboard")
+
+    def import_urls(self, urls, source):
+        if self.url_importer.running:
+            self.status_label.setText("An import is already running.")
+            return
+        self.ensure_tab_built(1)
+        self.tab_bar.setCurrentIndex(1)
+        format_text = self.format_combo.currentText()
+        quality = (self.resolution_combo.currentText() or '720p') if "Video" in format_text else "Audio"
+        self.import_counts = {'source': source, 'queued': 0, 'failed': 0, 'format_text': format_text, 'quality': quality}
+        self.url_importer.start(urls, format_text, quality)
+        self.import_status_label.setText(f"Importing URLs from {source}...")
+        self.import_status_label.setVisible(True)
+
+    def enqueue_items(self, items):
+        items = self.skip_downloaded_items(items)
+        self.queue_store.add(items)
+        if not (self.is_downloading and self.is_direct_download):
+            # During a direct download the items wait in the store and are restored into the queue when it ends
+            self.download_queue.extend(items)
+            if self.queue_table is not None:
+                self.add_queue_rows(items)
+            if self.is_downloading:
+                self.queue_total += len(items)
+                self.process_download_queue()
+        return items
+
+    def on_urls_imported(self, items, errors):
+        items = self.enqueue_items(items)
+        if errors:
+            # Unresolvable URLs go to the Failed list, where Retry Failed can queue them again
+            failed = [{'title': url or 'Import', 'url': url, 'selected_format_text': self.import_counts['format_text'],
+                       'selected_quality': self.import_counts['quality']} for url, _ in errors]
+            self.queue_store.add(failed, state='failed', messages=[message for _, message in errors])
+            self.populate_failed_table()
+        self.import_counts['queued'] += len(items)
+        self.import_counts['failed'] += len(errors)
+        self.import_status_label.setText(f"Importing URLs from {self.import_counts['source']}: {self.import_counts['queued']} queued, "
+                                         f"{self.import_counts['failed']} failed ({self.url_importer.read_count} URLs read)...")
+
+    def on_url_import_done(self):
+        if self.url_importer.cancelled:
+            self.import_status_label.setText(f"Import from {self.import_counts['source']} stopped.")
+            return
+        message = f"Imported {self.import_counts['queued']} item(s) from {self.import_counts['source']}"
+        if self.import_counts['failed']:
+            message += f"; {self.import_counts['failed']} URL(s) failed, see the Failed list"
+        self.import_status_label.setText(message + ".")
+        if not self.is_downloading:
+            self.status_label.setText(message + ".")
+
     def init_history_tab(self):
         layout = QVBoxLayout(self.history_tab)
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(3)
-        self.history_table.setHorizontalHeaderLabels(["Title", "URL", "Date"])
+        search_layout = QHBoxLayout()
+        self.history_search_edit = QLineEdit()
+        self.history_search_edit.setPlaceholderText("Search title or URL")
+        search_layout.addWidget(self.history_search_edit, 1)
+        self.history_date_from_edit = QLineEdit()
+        self.history_date_from_edit.setPlaceholderText("From (YYYY-MM-DD)")
+        search_layout.addWidget(self.history_date_from_edit)
+        self.history_date_to_edit = QLineEdit()
+        self.history_date_to_edit.setPlaceholderText("To (YYYY-MM-DD)")
+        search_layout.addWidget(self.history_date_to_edit)
+        layout.addLayout(search_layout)
+        self.history_search_timer = QTimer(self)
+        self.history_search_timer.setSingleShot(True)
+        self.history_search_timer.setInterval(250)
+        self.history_search_timer.timeout.connect(self.apply_history_filter)
+        for edit in (self.history_search_edit, self.history_date_from_edit, self.history_date_to_edit):
+            edit.textChanged.connect(self.history_search_timer.start)
+
+        self.history_model = HistoryTableModel(self.history_store, self)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
         self.history_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
         self.history_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
-        self.history_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.history_table.setEditTriggers(QTableView.NoEditTriggers)
+        self.history_table.setSelectionBehavior(QTableView.SelectRows)
         self.history_table.verticalHeader().setVisible(False)
+        self.history_table.setToolTip("Double-click an entry to fetch it again.")
+        self.history_table.doubleClicked.connect(self.open_history_entry)
         layout.addWidget(self.history_table)
         history_controls = QHBoxLayout()
         self.clear_history_button = QPushButton("Clear History")
@@ -412,6 +2998,7 @@ class VideoDownloader(QWidget):
         history_controls.addStretch(1)
         history_controls.addWidget(self.clear_history_button)
         layout.addLayout(history_controls)
+        self.load_history()
 
     def init_settings_tab(self):
         layout = QVBoxLayout(self.settings_tab)
@@ -429,86 +3016,339 @@ class VideoDownloader(QWidget):
 
         filename_group = QGroupBox("Filename Template (yt-dlp format)")
         filename_layout = QVBoxLayout()
-        self.filename_template_edit = QLineEdit(self.settings.value("filenameTemplate", "%(title)s [%(id)s].%(ext)s", str))
+        self.filename_template_edit = QLineEdit(self.settings.value("filenameTemplate", DEFAULT_FILENAME_TEMPLATE, str))
         filename_layout.addWidget(self.filename_template_edit)
         filename_group.setLayout(filename_layout)
         layout.addWidget(filename_group)
 
-        rate_limit_group = QGroupBox("Download Speed Limit (e.g., 500K, 2M)")
+        rate_limit_group = QGroupBox("Total Download Speed Limit (e.g., 500K, 2M)")
         rate_limit_layout = QVBoxLayout()
         self.rate_limit_edit = QLineEdit(self.settings.value("rateLimit", "", str))
         rate_limit_layout.addWidget(self.rate_limit_edit)
+        rate_limit_layout.addWidget(QLabel("Speed limit schedule (overrides the limit above inside each window):"))
+        self.bandwidth_schedule_edit = QLineEdit(self.bandwidth_schedule)
+        self.bandwidth_schedule_edit.setPlaceholderText("e.g. 09:00-18:00=2M, 22:00-06:00=unlimited")
+        rate_limit_layout.addWidget(self.bandwidth_schedule_edit)
         rate_limit_group.setLayout(rate_limit_layout)
         layout.addWidget(rate_limit_group)
 
+        workers_group = QGroupBox("Parallel Downloads")
+        workers_layout = QVBoxLayout()
+        self.max_workers_spin = QSpinBox()
+        self.max_workers_spin.setRange(1, 16)
+        self.max_workers_spin.setValue(self.max_workers)
+        workers_layout.addWidget(self.max_workers_spin)
+        workers_group.setLayout(workers_layout)
+        layout.addWidget(workers_group)
+
+        fragments_group = QGroupBox("Concurrent Fragments (HLS/DASH streams)")
+        fragments_layout = QHBoxLayout()
+        fragments_layout.addWidget(QLabel("Maximum per host:"))
+        self.max_fragments_spin = QSpinBox()
+        self.max_fragments_spin.setRange(1, 32)
+        self.max_fragments_spin.setValue(self.max_fragments)
+        fragments_layout.addWidget(self.max_fragments_spin)
+        self.fragment_auto_checkbox = QCheckBox("Auto-tune from throughput and errors")
+        self.fragment_auto_checkbox.setChecked(self.fragment_auto_tune)
+        fragments_layout.addWidget(self.fragment_auto_checkbox, 1)
+        fragments_group.setLayout(fragments_layout)
+        layout.addWidget(fragments_group)
+
+        connections_group = QGroupBox("Connections Per File (direct media files, 1 = off)")
+        connections_layout = QVBoxLayout()
+        self.connections_spin = QSpinBox()
+        self.connections_spin.setRange(1, 16)
+        self.connections_spin.setValue(self.segmented_connections)
+        connections_layout.addWidget(self.connections_spin)
+        connections_group.setLayout(connections_layout)
+        layout.addWidget(connections_group)
+
+        refresh_group = QGroupBox("Progress Refresh Rate (updates per second)")
+        refresh_layout = QVBoxLayout()
+        self.refresh_rate_spin = QSpinBox()
+        self.refresh_rate_spin.setRange(1, 30)
+        self.refresh_rate_spin.setValue(self.progress_refresh_rate)
+        refresh_layout.addWidget(self.refresh_rate_spin)
+        refresh_group.setLayout(refresh_layout)
+        layout.addWidget(refresh_group)
+
+        archive_group = QGroupBox("Download Archive")
+        archive_layout = QVBoxLayout()
+        self.skip_downloaded_checkbox = QCheckBox("Skip videos already downloaded in the same format and quality")
+        self.skip_downloaded_checkbox.setChecked(self.skip_downloaded)
+        archive_layout.addWidget(self.skip_downloaded_checkbox)
+        archive_group.setLayout(archive_layout)
+        layout.addWidget(archive_group)
+
+        cache_group = QGroupBox("Metadata Cache")
+        cache_layout = QHBoxLayout()
+        cache_layout.addWidget(QLabel("Fetched video details are reused for a few hours."), 1)
+        clear_cache_button = QPushButton("Clear Cache")
+        clear_cache_button.clicked.connect(self.clear_metadata_cache)
+        cache_layout.addWidget(clear_cache_button)
+        cache_group.setLayout(cache_layout)
+        layout.addWidget(cache_group)
+
+        partial_group = QGroupBox("Partial Downloads")
+        partial_layout = QHBoxLayout()
+        partial_layout.addWidget(QLabel("Remove leftover .part and fragment files from the output folder."), 1)
+        remove_partials_button = QPushButton("Clean Up")
+        remove_partials_button.clicked.connect(self.remove_partial_downloads)
+        partial_layout.addWidget(remove_partials_button)
+        partial_group.setLayout(partial_layout)
+        layout.addWidget(partial_group)
+
+        api_group = QGroupBox("Local API")
+        api_layout = QGridLayout()
+        self.api_enabled_checkbox = QCheckBox("Accept downloads from scripts and browser extensions on this computer")
+        self.api_enabled_checkbox.setChecked(self.api_enabled)
+        api_layout.addWidget(self.api_enabled_checkbox, 0, 0, 1, 3)
+        api_layout.addWidget(QLabel(f"Port (on {API_HOST}):"), 1, 0)
+        self.api_port_spin = QSpinBox()
+        self.api_port_spin.setRange(1024, 65535)
+        self.api_port_spin.setValue(self.api_port)
+        api_layout.addWidget(self.api_port_spin, 1, 1)
+        api_layout.addWidget(QLabel("Token:"), 2, 0)
+        self.api_token_edit = QLineEdit(self.api_token)
+        self.api_token_edit.setReadOnly(True)
+        self.api_token_edit.setToolTip("Send as 'Authorization: Bearer <token>'")
+        api_layout.addWidget(self.api_token_edit, 2, 1)
+        new_token_button = QPushButton("New Token")
+        new_token_button.clicked.connect(self.regenerate_api_token)
+        api_layout.addWidget(new_token_button, 2, 2)
+        api_group.setLayout(api_layout)
+        layout.addWidget(api_group)
+
         save_button = QPushButton("Save Settings")
         save_button.clicked.connect(self.save_settings)
         layout.addWidget(save_button, 0, Qt.AlignRight)
 
+    def init_stats_tab(self):
+        layout = QVBoxLayout(self.stats_tab)
+        session_group = QGroupBox("This Session")
+        session_layout = QGridLayout()
+        self.stats_labels = {}
+        fields = [('jobs', "Jobs:"), ('avg_throughput', "Average throughput:"), ('peak_throughput', "Peak throughput:"),
+                  ('bytes_downloaded', "Downloaded:"), ('bytes_written', "Written to disk:"),
+                  ('metadata_seconds', "Avg. metadata fetch:"), ('time_to_first_byte', "Avg. time to first byte:"),
+                  ('transfer_seconds', "Avg. transfer time:"), ('postprocess_seconds', "Avg. post-processing:")]
+        for i, (key, caption) in enumerate(fields):
+            row, column = divmod(i, 2)
+            session_layout.addWidget(QLabel(caption), row, column * 2)
+            self.stats_labels[key] = QLabel("N/A")
+            self.stats_labels[key].setObjectName("file_info")
+            session_layout.addWidget(self.stats_labels[key], row, column * 2 + 1)
+        session_group.setLayout(session_layout)
+        layout.addWidget(session_group)
+
+        layout.addWidget(QLabel("Recent jobs:"))
+        self.stats_table = QTableWidget()
+        self.stats_table.setColumnCount(8)
+        self.stats_table.setHorizontalHeaderLabels(["Title", "Status", "First Byte", "Transfer", "Average", "Peak", "Post-processing", "Size"])
+        self.stats_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.stats_table.verticalHeader().setVisible(False)
+        self.stats_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.stats_table)
+        paths_label = QLabel(f"Per-job records: {self.metrics.log_path}\nPrometheus metrics: {self.metrics.prometheus_path}")
+        paths_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        layout.addWidget(paths_label)
+
+    def refresh_stats_view(self):
+        if self.stats_table is None:
+            return
+        seconds = lambda value: f"{value:.2f}s" if value is not None else "N/A"
+        session = self.metrics.session()
+        jobs = session['jobs']
+        self.stats_labels['jobs'].setText(", ".join(f"{count} {status}" for status, count in sorted(jobs.items())) or "None yet")
+        self.stats_labels['avg_throughput'].setText(format_speed(session['avg_throughput']))
+        self.stats_labels['peak_throughput'].setText(format_speed(session['peak_throughput']))
+        self.stats_labels['bytes_downloaded'].setText(format_file_size(session['bytes_downloaded']))
+        self.stats_labels['bytes_written'].setText(format_file_size(session['bytes_written']))
+        for key, _, _ in METRIC_TIMINGS:
+            self.stats_labels[key].setText(seconds(session['means'].get(key)))
+
+        recent = session['recent'][::-1]
+        self.stats_table.setRowCount(len(recent))
+        for row, record in enumerate(recent):
+            values = [record['title'] or 'N/A', record['status'], seconds(record['time_to_first_byte']),
+                      seconds(record['transfer_seconds']), format_speed(record['avg_throughput']),
+                      format_speed(record['peak_throughput']), seconds(record['postprocess_seconds']),
+                      format_file_size(record['bytes_written'] or record['bytes_downloaded'])]
+            for column, value in enumerate(values):
+                cell = QTableWidgetItem(value)
+                if column == 1 and record.get('message'):
+                    cell.setToolTip(record['message'])
+                self.stats_table.setItem(row, column, cell)
+
     def dragEnterEvent(self, event):
-        if event.mimeData().hasUrls():
+        if event.mimeData().hasUrls() or event.mimeData().hasText():
             event.acceptProposedAction()
 
     def dropEvent(self, event):
+        # A single link is fetched for preview as before; several links or a dropped .txt/.csv list go straight into the queue
         urls = event.mimeData().urls()
-        if urls:
+        if len(urls) == 1 and urls[0].isLocalFile() and urls[0].toLocalFile().lower().endswith(URL_LIST_SUFFIXES):
+            self.import_urls(read_url_file(urls[0].toLocalFile()), os.path.basename(urls[0].toLocalFile()))
+        elif len(urls) > 1:
+            self.import_urls([url.toString() for url in urls if not url.isLocalFile()], "the dropped links")
+        elif urls:
             self.url_input.setText(urls[0].toLocalFile() if urls[0].isLocalFile() else urls[0].toString())
             self.fetch_video_info()
+        elif event.mimeData().hasText():
+            lines = list(parse_url_lines(event.mimeData().text().splitlines()))
+            if len(lines) > 1:
+                self.import_urls(lines, "the dropped text")
+            elif lines:
+                self.url_input.setText(lines[0])
+                self.fetch_video_info()
 
     def fetch_video_info(self):
+        if self.playlist_loading:
+            # The button reads "Stop Loading" while a playlist is listed; what has arrived so far stays usable
+            self.info_thread.stop()
+            self.fetch_button.setEnabled(False)
+            return
         url = self.url_input.text()
-        if not url: return
+        if not url or self.is_fetching_info: return
+        try:
+            entry_range = parse_entry_range(self.playlist_limit_edit.text())
+        except ValueError as e:
+            self.status_label.setText(str(e))
+            return
         self.reset_info_fields()
         self.status_label.setText("Fetching information...")
+        self.is_fetching_info = True
         self.fetch_button.setEnabled(False)
+        self.fetch_started = time.perf_counter()
         
-        self.info_thread = InfoFetcherThread(url)
+        self.info_thread = InfoFetcherThread(url, cache=self.metadata_cache, stream=True, entry_range=entry_range)
         self.info_thread.finished.connect(self.on_info_fetched)
         self.info_thread.error.connect(self.on_info_fetch_error)
+        self.info_thread.playlist_started.connect(self.on_playlist_started)
+        self.info_thread.entries_page.connect(self.on_playlist_page)
+        self.info_thread.playlist_finished.connect(self.on_playlist_finished)
         self.info_thread.start()
 
     def on_info_fetch_error(self, error_message):
+        if self.sender() is not self.info_thread:
+            return
         self.status_label.setText(f"Error fetching info: {error_message}")
-        self.fetch_button.setEnabled(True)
+        self.playlist_loading = False
+        self.finish_info_fetch()
+
+    def finish_info_fetch(self):
+        self.is_fetching_info = False
+        self.fetch_button.setText("Fetch Info")
+        self.fetch_button.setEnabled(not self.is_downloading)
+        if self.fetched_info is not None and self.format_index is not None:
+            self.action_widget.setEnabled(not self.is_downloading)
 
     def on_info_fetched(self, info):
+        if self.sender() is not self.info_thread:
+            return
         if not info:
             self.on_info_fetch_error("No information returned.")
             return
 
+        # Playlists arrive through on_playlist_started/on_playlist_page; this is a single video
+        list_latency = time.perf_counter() - self.fetch_started
         self.fetched_info = info
-        is_playlist = 'entries' in info and info.get('entries')
+        if info.get('is_live'):
+            self.status_label.setText("Live streams cannot be downloaded.")
+            self.finish_info_fetch()
+            return
+        info['metadata_seconds'] = list_latency
+        self.playlist_items = [info]
+        self.update_ui_with_video_info(info)
+        self.status_label.setText(f"Video info fetched successfully! (fetch: {list_latency:.2f}s)")
 
-        if is_playlist:
-            self.playlist_items = [entry for entry in info['entries'] if entry and not entry.get('is_live')]
-            if not self.playlist_items:
-                self.status_label.setText("Playlist contains no valid videos.")
-                self.fetch_button.setEnabled(True)
-                return
-            
-            first_video_url = self.playlist_items[0].get('url') or self.playlist_items[0].get('webpage_url')
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl_single:
-                try:
-                    first_video_info = ydl_single.extract_info(first_video_url, download=False)
-                    self.update_ui_with_video_info(first_video_info)
-                    self.fetched_info = first_video_info # Set main info to first video for format selection
-                    self.populate_playlist_view()
-                    self.status_label.setText(f"Playlist fetched: {len(self.playlist_items)} videos.")
-                except Exception as e:
-                    self.on_info_fetch_error(str(e))
-                    return
-        else: # Single Video
-            if info.get('is_live'):
-                self.status_label.setText("Live streams cannot be downloaded.")
-                self.fetch_button.setEnabled(True)
-                return
-            self.playlist_items = [info]
-            self.update_ui_with_video_info(info)
-            self.status_label.setText("Video info fetched successfully!")
+        self.action_widget.setEnabled(not self.is_downloading)
+        self.finish_info_fetch()
 
-        self.action_widget.setEnabled(True)
+    def on_playlist_started(self, info):
+        # Show the list as it is enumerated; formats come from probing the first video
+        if self.sender() is not self.info_thread:
+            return
+        self.fetched_info = info
+        self.playlist_items = []
+        self.playlist_loading = True
+        self.probe_latency = None
+        self.video_title.setText(f"Title: {info.get('title', 'N/A')}")
+        self.populate_playlist_view()
+        self.fetch_button.setText("Stop Loading")
         self.fetch_button.setEnabled(True)
 
+    def on_playlist_page(self, entries):
+        if self.sender() is not self.info_thread:
+            return
+        entries = [entry for entry in entries if not entry.get('is_live')]
+        if not entries:
+            return
+        probe_first = not self.playlist_items
+        # The model holds self.playlist_items itself, so this extends both
+        self.playlist_model.append_items(entries)
+        if self.format_index is not None:
+            self.update_file_size()
+        if self.playlist_loading:
+            self.status_label.setText(f"Loading playlist: {len(self.playlist_items)} videos so far...")
+        if probe_first:
+            first_video_url = entries[0].get('url') or entries[0].get('webpage_url')
+            self.probe_pending = True
+            self.probe_started = time.perf_counter()
+            self.probe_thread = InfoFetcherThread(first_video_url, flat=False, cache=self.metadata_cache)
+            self.probe_thread.finished.connect(self.on_first_video_probed)
+            self.probe_thread.error.connect(self.on_probe_error)
+            self.probe_thread.start()
+
+    def on_playlist_finished(self, complete):
+        if self.sender() is not self.info_thread:
+            return
+        self.playlist_loading = False
+        self.playlist_list_latency = time.perf_counter() - self.fetch_started
+        self.playlist_complete = complete
+        if not self.playlist_items:
+            self.status_label.setText("Playlist contains no valid videos.")
+            self.finish_info_fetch()
+            return
+        self.fetch_button.setText("Fetch Info")
+        self.fetch_button.setEnabled(False)
+        self.finish_playlist_fetch()
+
+    def on_probe_error(self, error_message):
+        if self.sender() is not self.probe_thread:
+            return
+        self.probe_pending = False
+        self.status_label.setText(f"Error fetching formats: {error_message}")
+        if not self.playlist_loading:
+            self.finish_info_fetch()
+
+    def on_first_video_probed(self, first_video_info):
+        if self.sender() is not self.probe_thread:
+            return
+        self.probe_pending = False
+        if not first_video_info:
+            self.on_probe_error("No information returned.")
+            return
+
+        self.probe_latency = time.perf_counter() - self.probe_started
+        self.fetched_info = first_video_info # Set main info to first video for format selection
+        self.update_ui_with_video_info(first_video_info)
+        # The first pages can be queued while the rest of the playlist is still being listed
+        self.action_widget.setEnabled(not self.is_downloading)
+        if self.playlist_loading:
+            self.status_label.setText(f"Loading playlist: {len(self.playlist_items)} videos so far "
+                                      f"(formats: {self.probe_latency:.2f}s)...")
+        self.finish_playlist_fetch()
+
+    def finish_playlist_fetch(self):
+        if self.playlist_loading or self.probe_pending:
+            return
+        stopped = "" if self.playlist_complete else ", stopped early"
+        formats = f", formats: {self.probe_latency:.2f}s" if self.probe_latency is not None else ""
+        self.status_label.setText(f"Playlist fetched: {len(self.playlist_items)} videos "
+                                  f"(list: {self.playlist_list_latency:.2f}s{formats}{stopped}).")
+        self.finish_info_fetch()
+
     def update_ui_with_video_info(self, video_info):
         self.video_title.setText(f"Title: {video_info.get('title', 'N/A')}")
         duration = video_info.get('duration')
@@ -518,103 +3358,109 @@ class VideoDownloader(QWidget):
         else:
             self.video_duration.setText("Duration: N/A")
 
-        thumbnail_url = video_info.get('thumbnail')
-        if thumbnail_url:
-            self.thumbnail_downloader = ThumbnailDownloaderThread(thumbnail_url)
-            self.thumbnail_downloader.finished.connect(self.set_thumbnail)
-            self.thumbnail_downloader.start()
+        self.thumbnail_url = video_info.get('thumbnail')
+        if self.thumbnail_url:
+            pixmap = self.thumbnail_loader.request(self.thumbnail_url, self.thumbnail_label.size())
+            if pixmap is not None:
+                self.set_thumbnail(pixmap)
         
+        self.format_index = self.format_index_for(video_info)
+        # Refill quietly; toggle_resolution_box below updates the size estimate once
+        self.resolution_combo.blockSignals(True)
         self.resolution_combo.clear()
-        resolutions = sorted(
-            list(set(f['height'] for f in video_info.get('formats', []) if f.get('height') and f.get('vcodec') != 'none')),
-            reverse=True
-        )
-        if resolutions:
-            self.resolution_combo.addItems([f"{h}p" for h in resolutions])
+        if self.format_index.heights:
+            self.resolution_combo.addItems([f"{h}p" for h in self.format_index.heights])
             self.resolution_combo.setEnabled(True)
         else:
             self.resolution_combo.setEnabled(False)
+        self.resolution_combo.blockSignals(False)
         
         self.toggle_resolution_box()
-        self.update_file_size()
+
+    def format_index_for(self, video_info):
+        key = video_id_key(video_info) or self.get_video_url(video_info)
+        if key not in self.format_indexes:
+            self.format_indexes[key] = FormatIndex(video_info.get('formats'))
+        return self.format_indexes[key]
+
+    def on_thumbnail_loaded(self, url, pixmap):
+        if url == self.thumbnail_url:
+            self.set_thumbnail(pixmap)
 
     def set_thumbnail(self, pixmap):
         if not pixmap.isNull():
-            self.thumbnail_label.setPixmap(pixmap.scaled(self.thumbnail_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            self.thumbnail_label.setPixmap(pixmap)
     
-    def clear_playlist_view(self):
-        while self.video_list_layout.count():
-            child = self.video_list_layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
-
     def populate_playlist_view(self):
-        self.clear_playlist_view()
-        for entry in self.playlist_items:
-            checkbox = QCheckBox(f"{entry.get('title', 'Untitled')}")
-            checkbox.setChecked(True)
-            self.video_list_layout.addWidget(checkbox)
-        self.playlist_scroll_area.setVisible(True)
-
-    def format_file_size(self, size_bytes):
-        if size_bytes is None or size_bytes == 0:
-            return "N/A"
-        size_name = ("B", "KB", "MB", "GB", "TB")
-        i = int(math.floor(math.log(size_bytes, 1024)))
-        p = math.pow(1024, i)
-        s = round(size_bytes / p, 2)
-        return f"{s} {size_name[i]}"
+        self.playlist_filter_edit.clear()
+        self.playlist_model.set_items(self.playlist_items)
+        self.playlist_panel.setVisible(True)
+
+    def set_visible_playlist_items_checked(self, checked):
+        if self.playlist_proxy.filterRegExp().isEmpty():
+            rows = range(self.playlist_model.rowCount())
+        else:
+            rows = [self.playlist_proxy.mapToSource(self.playlist_proxy.index(row, 0)).row()
+                    for row in range(self.playlist_proxy.rowCount())]
+        self.playlist_model.set_checked(rows, checked)
+
+    def select_playlist_range(self):
+        # 1-based, inclusive ranges as shown in the list, e.g. "1-50, 80"
+        rows = set()
+        count = self.playlist_model.rowCount()
+        try:
+            for part in self.playlist_range_edit.text().split(','):
+                if not part.strip():
+                    continue
+                start, _, end = part.partition('-')
+                start = int(start)
+                end = int(end) if end.strip() else start
+                rows.update(range(max(start, 1) - 1, min(end, count)))
+        except ValueError:
+            self.status_label.setText("Invalid range. Use numbers like 1-50, 80.")
+            return
+        self.playlist_model.check_only(rows)
+
+    def update_playlist_selection_label(self):
+        self.playlist_selection_label.setText(f"{len(self.playlist_model.checked)} of {self.playlist_model.rowCount()} selected")
 
     # ====================================================================
     # START OF MODIFIED FUNCTION
     # ====================================================================
     def update_file_size(self, *args):
-        if not self.fetched_info or 'formats' not in self.fetched_info:
+        if self.format_index is None:
             self.file_info.setText("Estimated File Size: N/A")
             return
 
-        total_size = 0
-        formats = self.fetched_info.get('formats')
-        if not formats:
+        audio_only = "Audio" in self.format_combo.currentText()
+        try:
+            height = None if audio_only else int(self.resolution_combo.currentText().replace('p', ''))
+        except ValueError:
             self.file_info.setText("Estimated File Size: N/A")
             return
 
-        # --- Audio Only Case ---
-        if "Audio" in self.format_combo.currentText():
-            audio_formats = [f for f in formats if f and f.get('acodec') != 'none' and f.get('vcodec') == 'none']
-            if audio_formats:
-                best_audio = max(audio_formats, key=lambda x: x.get('abr', 0) or 0, default=None)
-                if best_audio:
-                    total_size = best_audio.get('filesize') or best_audio.get('filesize_approx') or 0
-        
-        # --- Video + Audio Case ---
-        else:
-            selected_height_str = self.resolution_combo.currentText()
-            if not selected_height_str:
-                self.file_info.setText("Estimated File Size: N/A")
-                return
-            
-            try:
-                selected_height = int(selected_height_str.replace('p', ''))
-            except (ValueError, TypeError):
-                self.file_info.setText("Estimated File Size: N/A")
-                return
+        if self.playlist_panel.isHidden():
+            self.file_info.setText(f"Estimated File Size: {format_file_size(self.format_index.estimate(audio_only, height))}")
+            return
+
+        # Flat playlist entries have no formats yet; scale by duration using the probed video's bitrate
+        reference_size = self.format_index.estimate(audio_only, height)
+        reference_duration = self.fetched_info.get('duration')
+        bytes_per_second = reference_size / reference_duration if reference_size and reference_duration else 0
+        sizes = []
+        for item in self.playlist_items:
+            if item.get('formats'):
+                sizes.append(self.format_index_for(item).estimate(audio_only, height))
+            else:
+                sizes.append(int((item.get('duration') or 0) * bytes_per_second))
+        self.playlist_model.set_sizes(sizes)
 
-            # Calculate video size
-            matching_videos = [f for f in formats if f and f.get('height') == selected_height and f.get('vcodec') != 'none']
-            if matching_videos:
-                best_video = max(matching_videos, key=lambda x: x.get('tbr', 0) or 0, default=None)
-                if best_video:
-                    total_size += best_video.get('filesize') or best_video.get('filesize_approx') or 0
-
-            # Calculate audio size to be merged
-            audio_formats = [f for f in formats if f and f.get('acodec') != 'none' and f.get('vcodec') == 'none']
-            if audio_formats:
-                best_audio = max(audio_formats, key=lambda x: x.get('abr', 0) or 0, default=None)
-                if best_audio:
-                    total_size += best_audio.get('filesize') or best_audio.get('filesize_approx') or 0
-
-        self.file_info.setText(f"Estimated File Size: {self.format_file_size(total_size)}")
+    def show_selected_size(self):
+        if not self.playlist_model.sizes:
+            return
+        count = len(self.playlist_model.checked)
+        self.file_info.setText(f"Estimated File Size: {format_file_size(self.playlist_model.selected_size)} "
+                               f"({count} video{'s' if count != 1 else ''})")
     # ====================================================================
     # END OF MODIFIED FUNCTION
     # ====================================================================
@@ -627,11 +3473,8 @@ class VideoDownloader(QWidget):
         
     def get_selected_items_from_downloader_tab(self):
         selected_items = []
-        if self.playlist_scroll_area.isVisible():
-            for i in range(self.video_list_layout.count()):
-                checkbox = self.video_list_layout.itemAt(i).widget()
-                if checkbox and checkbox.isChecked():
-                    selected_items.append(self.playlist_items[i])
+        if not self.playlist_panel.isHidden():
+            selected_items = self.playlist_model.selected_items()
         elif self.playlist_items:
             selected_items.append(self.playlist_items[0])
         return selected_items
@@ -641,35 +3484,50 @@ class VideoDownloader(QWidget):
         if not selected_items:
             self.status_label.setText("No items selected to add.")
             return
+        self.ensure_tab_built(1)
 
+        new_items = []
         for item in selected_items:
-            row_position = self.queue_table.rowCount()
-            self.queue_table.insertRow(row_position)
-            
+            item = item.copy()
             item['selected_quality'] = self.resolution_combo.currentText() if "Video" in self.format_combo.currentText() else "Audio"
             item['selected_format_text'] = self.format_combo.currentText()
-            
-            self.queue_table.setItem(row_position, 0, QTableWidgetItem(item.get('title', 'N/A')))
-            self.queue_table.setItem(row_position, 1, QTableWidgetItem(item['selected_quality']))
-            self.queue_table.setItem(row_position, 2, QTableWidgetItem(item['selected_format_text']))
-            
-            self.download_queue.append(item.copy())
+            new_items.append(item)
+        new_items = self.skip_downloaded_items(new_items)
+        skipped = len(selected_items) - len(new_items)
+        self.queue_store.add(new_items)
+        self.add_queue_rows(new_items)
+        self.download_queue.extend(new_items)
         
         self.tab_bar.setCurrentIndex(1)
-        self.status_label.setText(f"Added {len(selected_items)} item(s) to the queue.")
+        message = f"Added {len(new_items)} item(s) to the queue."
+        if skipped:
+            message += f" Skipped {skipped} already downloaded."
+        self.status_label.setText(message)
 
     def start_direct_download(self):
         if self.is_downloading: return
         
-        self.download_queue = self.get_selected_items_from_downloader_tab()
+        selected_items = [item.copy() for item in self.get_selected_items_from_downloader_tab()]
         
-        if not self.download_queue:
+        if not selected_items:
             self.status_label.setText("No items selected to download.")
             return
+        if not self.output_path:
+            self.status_label.setText("Please set a default download folder in Settings.")
+            self.tab_bar.setCurrentIndex(3)
+            return
         
-        for item in self.download_queue:
+        for item in selected_items:
             item['selected_quality'] = self.resolution_combo.currentText() if "Video" in self.format_combo.currentText() else "Audio"
             item['selected_format_text'] = self.format_combo.currentText()
+        kept_items = self.skip_downloaded_items(selected_items)
+        if not kept_items:
+            self.status_label.setText(f"All {len(selected_items)} selected item(s) were already downloaded.")
+            return
+        selected_items = kept_items
+        # Direct downloads are journaled too, so a crash puts them into the queue on the next launch
+        self.queue_store.add(selected_items)
+        self.download_queue = selected_items
 
         self.start_queue_download(is_direct=True)
 
@@ -685,130 +3543,416 @@ class VideoDownloader(QWidget):
             return
             
         self.is_downloading = True
+        self.is_direct_download = is_direct
+        self.queue_total = len(self.download_queue)
+        self.queue_completed = 0
+        self.failed_count = 0
         self.set_controls_enabled(False)
-        self.process_download_queue(is_direct)
+        self.reset_progress_bar(determinate=True)
+        self.progress_timer.start(int(1000 / self.progress_refresh_rate))
+        self.process_download_queue()
+
+    def process_download_queue(self):
+        while self.is_downloading and self.download_queue and len(self.active_downloads) < self.max_workers:
+            index = self.next_ready_index()
+            if index is None:
+                break
+            next_video = self.download_queue[index]
+            # Flat playlist entries need their full info (formats) before download
+            if 'formats' not in next_video:
+                result = self.metadata_prefetcher.take(self.get_video_url(next_video))
+                if result is None:
+                    self.metadata_prefetcher.request(self.get_video_url(next_video), video_id_key(next_video))
+                    if not self.active_downloads:
+                        self.status_label.setText(f"Fetching details: {next_video.get('title', 'Unknown Video')}")
+                    break
+                info, error = result
+                if error:
+                    self.take_from_queue(index)
+                    self.record_download_result(False, error, next_video)
+                    continue
+                if info.get('entries') is not None:
+                    self.expand_queued_playlist(index, info)
+                    continue
+                next_video.update(info)
+                # Entries without an id in the flat listing can only be checked once their info is known
+                if not self.skip_downloaded_items([next_video]):
+                    self.take_from_queue(index)
+                    self.queue_store.remove([next_video.get('queue_id')])
+                    self.queue_completed += 1
+                    continue
+            self.start_next_download(index)
 
-    def process_download_queue(self, is_direct=False):
-        if not self.download_queue or not self.is_downloading:
-            self.on_all_downloads_finished()
+        self.prefetch_upcoming_metadata()
+
+        if not self.is_downloading:
             return
-        
-        video_to_download = self.download_queue.pop(0)
-        if not is_direct:
-            self.queue_table.removeRow(0)
+        if self.download_queue:
+            self.schedule_retry_wakeup()
+        elif not self.active_downloads and not self.postprocessing_jobs:
+            if self.paused_downloads:
+                self.status_label.setText(f"{len(self.paused_downloads)} download(s) paused.")
+            else:
+                self.on_all_downloads_finished()
+
+    def next_ready_index(self):
+        # Items waiting for a retry or for a blocked host stay in place while later ones go ahead
+        now = time.time()
+        blocked = {}
+        for index, video in enumerate(self.download_queue):
+            if video.get('retry_at', 0) > now:
+                continue
+            host = item_host(video)
+            if host not in blocked:
+                blocked[host] = self.circuit_breaker.blocked_for(host) > 0
+            if not blocked[host]:
+                return index
+        return None
+
+    def schedule_retry_wakeup(self):
+        now = time.time()
+        ready_at = min(max(video.get('retry_at', 0), now + self.circuit_breaker.blocked_for(item_host(video)))
+                       for video in self.download_queue)
+        if ready_at <= now:
+            return
+        self.retry_timer.start(max(200, int((ready_at - now) * 1000)))
+        if not self.active_downloads and not self.postprocessing_jobs:
+            self.status_label.setText(f"Waiting {format_eta(ready_at - now)} to retry {len(self.download_queue)} item(s)...")
+
+    def take_from_queue(self, index):
+        video = self.download_queue.pop(index)
+        if not self.is_direct_download:
+            self.queue_table.removeRow(index)
+        return video
+
+    def expand_queued_playlist(self, index, info):
+        # A URL queued without its details turned out to be a playlist; its entries take its place in the queue
+        playlist = self.take_from_queue(index)
+        choice = {k: v for k, v in playlist.items() if k.startswith('selected_')}
+        entries = self.skip_downloaded_items([dict(strip_info(entry), **choice) for entry in info['entries']
+                                              if entry and not entry.get('is_live')])
+        self.queue_store.remove([playlist.get('queue_id')])
+        self.queue_store.add(entries)
+        self.download_queue[index:index] = entries
+        if not self.is_direct_download and self.queue_table is not None:
+            self.add_queue_rows(entries, index)
+        self.queue_total += len(entries) - 1
+        self.remember_result(playlist, 'expanded', entries=[entry.get('queue_id') for entry in entries])
+
+    def prefetch_upcoming_metadata(self):
+        if not self.is_downloading:
+            return
+        for video in self.download_queue[:self.max_workers + METADATA_PREFETCH_AHEAD]:
+            if 'formats' not in video:
+                self.metadata_prefetcher.request(self.get_video_url(video), video_id_key(video))
+
+    def on_metadata_ready(self, url):
+        if self.is_downloading:
+            self.process_download_queue()
+
+    def get_video_url(self, video_info):
+        return video_info.get('webpage_url') or video_info.get('url')
+
+    def start_next_download(self, index=0):
+        video_to_download = self.take_from_queue(index)
         
         title = video_to_download.get('title', 'Unknown Video')
-        format_text = video_to_download.get('selected_format_text', '')
-        
-        format_selector = ""
-        if "Audio" in format_text:
-            format_selector = 'bestaudio/best'
-            video_to_download['selected_format_type'] = 'audio'
-            video_to_download['selected_format_ext'] = 'mp3' if 'MP3' in format_text else 'm4a'
+        format_selector = resolve_format_selection(video_to_download)
+
+        self.queue_store.set_state(video_to_download.get('queue_id'), 'downloading')
+        job_id = next(self.job_ids)
+        job_widget = DownloadJobWidget(title)
+        job_widget.pause_button.clicked.connect(lambda _, job_id=job_id: self.toggle_job_pause(job_id))
+        job_widget.cancel_button.clicked.connect(lambda _, job_id=job_id: self.cancel_job(job_id))
+        self.jobs_layout.addWidget(job_widget)
+        self.launch_download(job_id, video_to_download, format_selector, job_widget)
+
+    def launch_download(self, job_id, video_info, format_selector, job_widget):
+        downloader_thread = DownloaderThread(video_info, format_selector, self.output_path, self.filename_template, self.rate_limit,
+                                             bandwidth=self.bandwidth, fragments=self.fragment_tuner,
+                                             connections=self.segmented_connections)
+        downloader_thread.postprocessing.connect(job_widget.on_postprocessing)
+        downloader_thread.finished.connect(lambda s, m, v, job_id=job_id: self.on_one_download_finished(job_id, s, m, v))
+        self.active_downloads[job_id] = (downloader_thread, job_widget)
+        self.update_download_status()
+        downloader_thread.start()
+
+    def toggle_job_pause(self, job_id):
+        if job_id in self.active_downloads:
+            downloader_thread, job_widget = self.active_downloads[job_id]
+            downloader_thread.job.pause()
+            job_widget.pause_button.setEnabled(False)
+            job_widget.speed_label.setText("Pausing...")
+        elif job_id in self.paused_downloads:
+            downloader_thread, job_widget = self.paused_downloads.pop(job_id)
+            video_info = downloader_thread.video_info
+            downloader_thread.deleteLater()
+            job_widget.set_paused(False)
+            self.queue_store.set_state(video_info.get('queue_id'), 'downloading')
+            self.launch_download(job_id, video_info, downloader_thread.job.format_selection, job_widget)
+
+    def cancel_job(self, job_id):
+        if job_id in self.active_downloads or job_id in self.postprocessing_jobs:
+            downloader_thread, job_widget = self.active_downloads.get(job_id) or self.postprocessing_jobs[job_id]
+            downloader_thread.job.cancel()
+            job_widget.pause_button.setEnabled(False)
+            job_widget.cancel_button.setEnabled(False)
+            job_widget.speed_label.setText("Cancelling...")
+        elif job_id in self.paused_downloads:
+            downloader_thread, job_widget = self.paused_downloads.pop(job_id)
+            downloader_thread.job.remove_partial_files()
+            downloader_thread.deleteLater()
+            self.jobs_layout.removeWidget(job_widget)
+            job_widget.deleteLater()
+            self.record_cancelled(downloader_thread.video_info)
+            if self.is_downloading:
+                self.process_download_queue()
+
+    def update_download_status(self):
+        active_titles = [job_widget.title_label.text() for _, job_widget in self.active_downloads.values()]
+        postprocessing = f", {len(self.postprocessing_jobs)} post-processing" if self.postprocessing_jobs else ""
+        if len(active_titles) == 1 and not postprocessing:
+            self.status_label.setText(f"Downloading: {active_titles[0]}")
+        elif active_titles or postprocessing:
+            self.status_label.setText(f"Downloading {len(active_titles)} items{postprocessing} ({self.queue_completed}/{self.queue_total} done)")
+
+    def refresh_download_progress(self):
+        for downloader_thread, job_widget in self.active_downloads.values():
+            job_widget.update_progress(downloader_thread.latest_progress)
+        self.update_overall_progress()
+
+    def update_overall_progress(self):
+        if not self.queue_total:
+            return
+        active_progress = sum(job_widget.progress_bar.value() for _, job_widget in self.active_downloads.values()
+                              if job_widget.progress_bar.maximum() > 0) + 100 * len(self.postprocessing_jobs)
+        overall = (self.queue_completed * 100 + active_progress) / self.queue_total
+        self.progress_bar.setValue(int(overall))
+        total_speed = sum(job_widget.speed for _, job_widget in self.active_downloads.values())
+        limit = self.bandwidth.stats()['limit']
+        if total_speed and limit:
+            self.progress_bar.setFormat(f"%p%  ({format_speed(total_speed)} of {format_speed(limit)})")
         else:
-            height = video_to_download.get('selected_quality', '720p')[:-1]
-            format_selector = f'bestvideo[height<={height}]+bestaudio/best'
-            video_to_download['selected_format_type'] = 'video'
-            video_to_download['selected_format_ext'] = 'mkv' if 'MKV' in format_text else 'mp4'
+            self.progress_bar.setFormat(f"%p%  ({format_speed(total_speed)})" if total_speed else "%p%")
 
-        self.status_label.setText(f"Downloading: {title}")
-        self.reset_progress_bar(determinate=True)
-        
-        # We may need to re-fetch full info for playlist items
-        full_video_info = video_to_download
-        if 'formats' not in video_to_download:
-             with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                try:
-                    info = ydl.extract_info(video_to_download.get('webpage_url') or video_to_download.get('url'), download=False)
-                    full_video_info.update(info)
-                except Exception as e:
-                    self.on_one_download_finished(False, str(e), video_to_download, is_direct)
-                    return
-        
-        full_video_info.update(video_to_download)
+    def on_one_download_finished(self, job_id, success, message, video_info):
+        job = self.active_downloads.pop(job_id, None)
+        if not job: # Job was already torn down by stop_download
+            return
+        downloader_thread, job_widget = job
+        downloader_thread.wait()
+        if downloader_thread.job.paused:
+            # The thread is done but the widget stays, so the job can be resumed from its .part file
+            self.paused_downloads[job_id] = job
+            job_widget.set_paused(True)
+            self.queue_store.set_state(video_info.get('queue_id'), 'paused')
+        elif success and downloader_thread.job.deferred:
+            # The download slot is free now; merging/converting continues on the post-processing pool
+            self.postprocessing_jobs[job_id] = job
+            job_widget.pause_button.setEnabled(False)
+            job_widget.on_postprocessing("Waiting to post-process...")
+            self.queue_store.set_state(video_info.get('queue_id'), 'postprocessing')
+            self.postprocessing_queue.submit(job_id, downloader_thread.job)
+        else:
+            self.finish_job(job_id, job, success, message)
+
+        if self.is_downloading:
+            self.process_download_queue()
 
-        self.downloader_thread = DownloaderThread(full_video_info, format_selector, self.output_path, self.filename_template, self.rate_limit)
-        self.downloader_thread.progress.connect(self.progress_bar.setValue)
-        self.downloader_thread.stats.connect(self.update_stats)
-        self.downloader_thread.postprocessing.connect(self.on_postprocessing)
-        self.downloader_thread.finished.connect(lambda s, m, v, direct=is_direct: self.on_one_download_finished(s, m, v, direct))
-        self.downloader_thread.start()
+    def on_postprocessing_finished(self, job_id, success, message):
+        job = self.postprocessing_jobs.pop(job_id, None)
+        if job is None:
+            return
+        self.finish_job(job_id, job, success, message)
+        if self.is_downloading:
+            self.process_download_queue()
 
-    def on_postprocessing(self, message):
-        self.status_label.setText(message)
-        self.progress_bar.setRange(0, 0)
+    def finish_job(self, job_id, job, success, message):
+        downloader_thread, job_widget = job
+        downloader_thread.deleteLater()
+        self.jobs_layout.removeWidget(job_widget)
+        job_widget.deleteLater()
+        status = 'cancelled' if downloader_thread.job.cancelled else 'completed' if success else 'failed'
+        self.metrics.record(downloader_thread.video_info, status, downloader_thread.job.metrics, message)
+        self.refresh_stats_view()
+        if downloader_thread.job.cancelled:
+            self.record_cancelled(downloader_thread.video_info)
+        else:
+            self.record_download_result(success, message, downloader_thread.video_info)
+
+    def remember_result(self, video_info, state, message=None, **extra):
+        queue_id = video_info.get('queue_id')
+        if queue_id is None:
+            return
+        self.api_results[queue_id] = dict(self.api_job(video_info, state), message=message, **extra)
+        self.api_results.move_to_end(queue_id)
+        if len(self.api_results) > API_RECENT_RESULTS:
+            self.api_results.popitem(last=False)
+
+    def record_cancelled(self, video_info):
+        self.remember_result(video_info, 'cancelled')
+        self.queue_store.remove([video_info.get('queue_id')])
+        self.queue_completed += 1
+        self.update_overall_progress()
+        self.update_download_status()
 
-    def on_one_download_finished(self, success, message, video_info, is_direct):
+    def record_download_result(self, success, message, video_info):
+        host = item_host(video_info)
         if success:
+            self.remember_result(video_info, 'completed', message)
             self.add_to_history(video_info)
+            self.history_store.add_to_archive(archive_key(video_info))
+            self.queue_store.remove([video_info.get('queue_id')])
+            self.circuit_breaker.record_success(host)
         else:
             print(f"Failed to download {video_info.get('title', 'N/A')}: {message}")
-        
-        if self.is_downloading:
-            self.process_download_queue(is_direct)
+            if self.circuit_breaker.record_failure(host, is_throttling_error(message)):
+                self.status_label.setText(f"{host} is rate limiting; pausing its downloads for "
+                                          f"{format_eta(self.circuit_breaker.blocked_for(host))}.")
+            attempts = video_info.get('retry_attempts', 0) + 1
+            if self.is_downloading and not is_permanent_error(message) and attempts < RETRY_MAX_ATTEMPTS:
+                video_info['retry_attempts'] = attempts
+                video_info['retry_at'] = time.time() + retry_delay(attempts)
+                self.queue_store.requeue(video_info, message)
+                self.download_queue.append(video_info)
+                if not self.is_direct_download:
+                    self.add_queue_row(video_info)
+                return
+            self.queue_store.set_state(video_info.get('queue_id'), 'failed', message)
+            self.remember_result(video_info, 'failed', message)
+            self.failed_count += 1
+            self.populate_failed_table()
+        self.queue_completed += 1
+        self.update_overall_progress()
+        self.update_download_status()
 
     def on_all_downloads_finished(self):
-        self.status_label.setText("All downloads completed!")
+        self.status_label.setText(f"All downloads completed! ({self.failed_count} failed, see the Queue tab)" if self.failed_count
+                                  else "All downloads completed!")
         self.is_downloading = False
+        self.progress_timer.stop()
+        self.restore_queue_from_store()
         self.set_controls_enabled(True)
         self.progress_bar.setRange(0, 100)
         self.progress_bar.setValue(100)
         self.open_folder_button.setVisible(True)
 
     def stop_download(self):
-        self.is_downloading = False
-        self.download_queue.clear()
-        self.queue_table.setRowCount(0)
-        if hasattr(self, 'downloader_thread') and self.downloader_thread.isRunning():
-            self.downloader_thread.terminate()
-            self.downloader_thread.wait()
+        stopped_items = [downloader_thread.video_info for downloader_thread, _ in
+                         list(self.active_downloads.values()) + list(self.paused_downloads.values())]
+        # Queued items resume later from their .part files; a stopped "Download Now" leaves nothing behind
+        self.halt_active_downloads(keep_partial_files=not self.is_direct_download)
+        if self.is_direct_download:
+            # A stopped "Download Now" is dropped; queued items stay for the next Start Queue Download
+            self.queue_store.remove([item.get('queue_id') for item in stopped_items + self.download_queue])
+        else:
+            self.queue_store.requeue_interrupted()
+        self.restore_queue_from_store()
         
-        self.status_label.setText("Download process stopped.")
+        self.status_label.setText(f"Download process stopped. {len(self.download_queue)} item(s) remain in the queue.")
         self.reset_progress_bar()
         self.set_controls_enabled(True)
 
+    def halt_active_downloads(self, keep_partial_files=True):
+        self.is_downloading = False
+        self.progress_timer.stop()
+        self.retry_timer.stop()
+        self.metadata_prefetcher.clear()
+        for downloader_thread, _ in self.active_downloads.values():
+            if keep_partial_files:
+                downloader_thread.job.pause()
+            else:
+                downloader_thread.job.cancel()
+        deadline = time.monotonic() + STOP_WAIT_SECONDS
+        for downloader_thread, job_widget in self.active_downloads.values():
+            if not downloader_thread.wait(max(0, int((deadline - time.monotonic()) * 1000))):
+                # Still blocked in a read; it stops on its own once that returns or times out
+                self.halted_threads.add(downloader_thread)
+                downloader_thread.finished.connect(lambda *_, thread=downloader_thread: self.release_halted_thread(thread))
+            else:
+                downloader_thread.deleteLater()
+            self.jobs_layout.removeWidget(job_widget)
+            job_widget.deleteLater()
+        for downloader_thread, job_widget in self.paused_downloads.values():
+            if not keep_partial_files:
+                downloader_thread.job.remove_partial_files()
+            downloader_thread.deleteLater()
+            self.jobs_layout.removeWidget(job_widget)
+            job_widget.deleteLater()
+        self.active_downloads.clear()
+        self.paused_downloads.clear()
+
+    def release_halted_thread(self, downloader_thread):
+        self.halted_threads.discard(downloader_thread)
+        downloader_thread.wait_detached()
+
+    def restore_queue_from_store(self):
+        self.is_direct_download = False
+        self.download_queue = self.queue_store.pending()
+        if self.queue_table is not None:
+            self.populate_queue_table()
+
     def set_controls_enabled(self, enabled):
-        self.fetch_button.setEnabled(enabled)
-        self.action_widget.setEnabled(self.fetched_info is not None and enabled)
-        self.start_queue_button.setEnabled(enabled)
-        self.clear_queue_button.setEnabled(enabled)
+        self.fetch_button.setEnabled(self.playlist_loading or enabled and not self.is_fetching_info)
+        # A playlist that is still being listed can be queued once the first video's formats are known
+        ready = not self.is_fetching_info or self.playlist_loading and self.format_index is not None
+        self.action_widget.setEnabled(self.fetched_info is not None and enabled and ready)
+        if self.queue_table is not None:
+            self.start_queue_button.setEnabled(enabled)
+            self.clear_queue_button.setEnabled(enabled)
+            self.retry_failed_button.setEnabled(enabled)
         self.stop_button.setEnabled(not enabled)
 
-    def update_stats(self, speed, eta):
-        self.speed_label.setText(f"Speed: {speed}")
-        self.eta_label.setText(f"ETA: {eta}")
-
     def reset_progress_bar(self, determinate=False):
+        self.progress_bar.setFormat("%p%")
         if determinate:
             self.progress_bar.setRange(0, 100)
             self.progress_bar.setValue(0)
         else:
             self.progress_bar.setRange(0, 0)
-        self.speed_label.setText("Speed: N/A")
-        self.eta_label.setText("ETA: N/A")
 
     def reset_info_fields(self):
         self.video_title.setText("Title:")
         self.video_duration.setText("Duration:")
         self.file_info.setText("Estimated File Size:")
+        self.thumbnail_url = None
+        self.format_index = None
+        self.format_indexes.clear()
         self.thumbnail_label.clear()
         self.thumbnail_label.setStyleSheet("border: 1px solid #43b581; background-color: #2C2F33;")
         self.resolution_combo.clear()
-        self.clear_playlist_view()
-        self.playlist_scroll_area.setVisible(False)
+        # Hand the model this same list so appended pages land in both
+        self.playlist_items = []
+        self.playlist_model.set_items(self.playlist_items)
+        self.playlist_panel.setVisible(False)
         self.action_widget.setEnabled(False)
         self.fetched_info = None
-        self.playlist_items = []
         self.open_folder_button.setVisible(False)
         self.reset_progress_bar()
         self.progress_bar.setValue(0)
+        if self.playlist_loading or self.probe_pending:
+            # Clearing mid-listing abandons the fetch; its late signals no longer match the current threads
+            self.info_thread.stop()
+            self.retire_thread(self.info_thread)
+            self.retire_thread(self.probe_thread)
+            self.info_thread = self.probe_thread = None
+            self.playlist_loading = self.probe_pending = False
+            self.status_label.setText("Playlist loading stopped.")
+            self.finish_info_fetch()
+
+    def retire_thread(self, thread):
+        # Keep a reference until the thread exits so Qt does not destroy it while it runs
+        self.retired_threads = [t for t in self.retired_threads if not t.isFinished()]
+        if thread is not None and not thread.isFinished():
+            self.retired_threads.append(thread)
 
     def select_output_folder(self):
         path = QFileDialog.getExistingDirectory(self, "Select Output Folder")
         if path:
             self.output_path = path
             self.status_label.setText(f"Output folder set to: {path}")
-            self.path_edit.setText(path)
+            if self.path_edit is not None:
+                self.path_edit.setText(path)
             self.settings.setValue("outputPath", path)
             
     def open_download_folder(self):
@@ -822,61 +3966,224 @@ class VideoDownloader(QWidget):
         if self.is_downloading: return
         self.download_queue.clear()
         self.queue_table.setRowCount(0)
+        self.queue_store.clear()
+        self.populate_failed_table()
+        self.metadata_prefetcher.clear()
+        self.url_importer.cancel()
         self.status_label.setText("Queue cleared.")
 
+    def apply_api_settings(self):
+        wanted = (self.api_port, self.api_token) if self.api_enabled else None
+        running = (self.api_server.port, self.api_server.token) if self.api_server else None
+        if wanted == running:
+            return
+        if self.api_server is not None:
+            self.api_server.stop()
+            self.api_server = None
+        if wanted is None:
+            return
+        server = LocalApiServer(self.api_port, self.api_token)
+        server.requests_ready.connect(lambda server=server: self.on_api_requests(server))
+        try:
+            server.start()
+        except OSError as e:
+            self.status_label.setText(f"Local API not started: {e}")
+            return
+        self.api_server = server
+
+    def on_api_requests(self, server):
+        requests = server.take_requests()
+        submissions = []
+        for method, path, data, future in requests:
+            try:
+                if (method, path) == ('POST', '/jobs'):
+                    submissions.append((self.api_job_items(data), data.get('start'), future))
+                else:
+                    future.set_result(self.handle_api_request(method, path))
+            except ApiRequestError as e:
+                future.set_result((e.status, {'error': str(e)}))
+        if submissions:
+            self.api_enqueue(submissions)
+
+    def api_job_items(self, data):
+        urls = data.get('urls', [data['url']] if 'url' in data else None)
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url.startswith(('http://', 'https://'))
+                                                              for url in urls):
+            raise ApiRequestError(400, "Send 'url' or a list of 'urls' with http(s) links.")
+        if len(urls) > API_MAX_URLS:
+            raise ApiRequestError(413, f"At most {API_MAX_URLS} URLs per request.")
+        format_text = FORMAT_NAMES.get(str(data.get('format', '')).lower(), self.format_combo.currentText())
+        if "Audio" in format_text:
+            quality = "Audio"
+        else:
+            quality = str(data.get('quality') or self.resolution_combo.currentText() or '720p')
+            if not re.fullmatch(r'\d+p', quality):
+                raise ApiRequestError(400, f"Invalid quality '{quality}', use e.g. 1080p.")
+        # Queued without details; the metadata prefetcher fills them in (or lists a playlist's entries) before each download
+        return [{'url': url, 'webpage_url': url, 'title': url, 'selected_format_text': format_text, 'selected_quality': quality}
+                for url in urls]
+
+    def api_enqueue(self, submissions):
+        # A burst of submissions is written to the store and added to the queue table in one go
+        self.ensure_tab_built(1)
+        queued = {id(item) for item in self.enqueue_items([item for items, _, _ in submissions for item in items])}
+        started = False
+        if any(start for _, start, _ in submissions) and not self.is_downloading and self.download_queue:
+            self.start_queue_download()
+            started = self.is_downloading
+        for items, _, future in submissions:
+            jobs = [{'id': item.get('queue_id'), 'url': item['url']} for item in items if id(item) in queued]
+            future.set_result((202, {'jobs': jobs, 'downloading': self.is_downloading, 'started': started}))
+        self.status_label.setText(f"Added {len(queued)} item(s) to the queue from the local API.")
+
+    def api_job(self, video_info, state):
+        return {'id': video_info.get('queue_id'), 'state': state, 'title': video_info.get('title'),
+                'url': self.get_video_url(video_info), 'attempts': video_info.get('retry_attempts', 0) + 1}
+
+    def api_running_jobs(self):
+        for state, jobs in (('downloading', self.active_downloads), ('paused', self.paused_downloads),
+                            ('postprocessing', self.postprocessing_jobs)):
+            for job_id, (downloader_thread, _) in jobs.items():
+                yield job_id, state, downloader_thread
+
+    def api_job_status(self, queue_id):
+        for _, state, downloader_thread in self.api_running_jobs():
+            if downloader_thread.video_info.get('queue_id') == queue_id:
+                job = self.api_job(downloader_thread.video_info, state)
+                progress = downloader_thread.latest_progress
+                if progress:
+                    job['progress'] = {k: progress.get(k) for k in ('downloaded_bytes', 'total_bytes', 'speed', 'eta')}
+                return job
+        if queue_id in self.api_results:
+            return self.api_results[queue_id]
+        for video_info in self.download_queue:
+            if video_info.get('queue_id') == queue_id:
+                job = self.api_job(video_info, 'queued')
+                if video_info.get('retry_at', 0) > time.time():
+                    job['retry_in'] = round(video_info['retry_at'] - time.time(), 1)
+                return job
+        stored = self.queue_store.get(queue_id)
+        if stored:
+            state, video_info, message = stored
+            return dict(self.api_job(video_info, state), message=message)
+        return None
+
+    def handle_api_request(self, method, path):
+        if path == '/jobs':
+            if method != 'GET':
+                raise ApiRequestError(405, "Use GET to list jobs or POST to add them.")
+            running = [self.api_job_status(downloader_thread.video_info.get('queue_id'))
+                       for _, _, downloader_thread in self.api_running_jobs()]
+            return 200, {'downloading': self.is_downloading, 'queued': len(self.download_queue), 'running': running,
+                         'completed': self.queue_completed, 'total': self.queue_total, 'failed': self.failed_count}
+        match = re.fullmatch(r'/jobs/(\d+)', path)
+        if not match:
+            raise ApiRequestError(404, "Unknown endpoint.")
+        queue_id = int(match.group(1))
+        if method == 'GET':
+            job = self.api_job_status(queue_id)
+            if job is None:
+                raise ApiRequestError(404, f"No job {queue_id}.")
+            return 200, job
+        if method == 'DELETE':
+            return self.api_cancel(queue_id)
+        raise ApiRequestError(405, "Use GET or DELETE on a job.")
+
+    def api_cancel(self, queue_id):
+        for job_id, state, downloader_thread in self.api_running_jobs():
+            if downloader_thread.video_info.get('queue_id') == queue_id:
+                self.cancel_job(job_id)
+                return 202, self.api_job(downloader_thread.video_info, 'cancelling')
+        for index, video_info in enumerate(self.download_queue):
+            if video_info.get('queue_id') == queue_id:
+                self.take_from_queue(index)
+                if self.is_downloading:
+                    self.queue_total -= 1
+                    self.update_overall_progress()
+                self.remember_result(video_info, 'cancelled')
+                self.queue_store.remove([queue_id])
+                return 200, self.api_results[queue_id]
+        stored = self.queue_store.get(queue_id)
+        if stored:
+            # Waiting in the store during a direct download, or in the Failed list
+            self.remember_result(stored[1], 'cancelled')
+            self.queue_store.remove([queue_id])
+            self.populate_failed_table()
+            return 200, self.api_results[queue_id]
+        raise ApiRequestError(404, f"No queued or running job {queue_id}.")
+
+    def regenerate_api_token(self):
+        self.api_token_edit.setText(secrets.token_urlsafe(24))
+
     def load_settings(self):
         self.output_path = self.settings.value("outputPath", "", str)
-        self.filename_template = self.settings.value("filenameTemplate", "%(title)s [%(id)s].%(ext)s", str)
+        self.filename_template = self.settings.value("filenameTemplate", DEFAULT_FILENAME_TEMPLATE, str)
         self.rate_limit = self.settings.value("rateLimit", "", str)
+        self.max_workers = self.settings.value("maxConcurrentDownloads", 1, int)
+        self.progress_refresh_rate = self.settings.value("progressRefreshRate", DEFAULT_PROGRESS_REFRESH_RATE, int)
+        self.skip_downloaded = self.settings.value("skipDownloaded", True, bool)
+        self.bandwidth_schedule = self.settings.value("bandwidthSchedule", "", str)
+        self.max_fragments = self.settings.value("maxConcurrentFragments", DEFAULT_MAX_FRAGMENTS, int)
+        self.fragment_auto_tune = self.settings.value("fragmentAutoTune", True, bool)
+        self.fragment_tuner.configure(self.max_fragments, self.fragment_auto_tune)
+        self.segmented_connections = self.settings.value("segmentedConnections", 1, int)
+        self.api_enabled = self.settings.value("apiEnabled", False, bool)
+        self.api_port = self.settings.value("apiPort", API_DEFAULT_PORT, int)
+        self.api_token = self.settings.value("apiToken", "", str)
+        if not self.api_token:
+            self.api_token = secrets.token_urlsafe(24)
+            self.settings.setValue("apiToken", self.api_token)
+        try:
+            # Running jobs pick up the new limits at their next progress update
+            self.bandwidth.configure(parse_rate(self.rate_limit), parse_schedule(self.bandwidth_schedule))
+        except ValueError as e:
+            print(f"Ignoring speed limit settings: {e}")
+            self.bandwidth.configure()
 
     def load_history(self):
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-                    for item in history:
-                        self.add_history_row(item)
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"Could not parse history file: {e}")
+        self.history_model.set_filter()
+
+    def apply_history_filter(self):
+        self.history_model.set_filter(self.history_search_edit.text().strip(),
+                                      self.history_date_from_edit.text().strip(),
+                                      self.history_date_to_edit.text().strip())
 
     def add_to_history(self, video_info):
-        history = []
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-            except (json.JSONDecodeError, IOError):
-                history = []
-        
-        history_item = {
-            'title': video_info.get('title', 'N/A'),
-            'url': video_info.get('webpage_url', 'N/A'),
-            'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        history.insert(0, history_item)
-        self.add_history_row(history_item, at_top=True)
-        
-        try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, indent=4, ensure_ascii=False)
-        except IOError as e:
-            print(f"Could not write to history file: {e}")
-            
-    def add_history_row(self, item, at_top=False):
-        row_position = 0 if at_top else self.history_table.rowCount()
-        self.history_table.insertRow(row_position)
-        self.history_table.setItem(row_position, 0, QTableWidgetItem(item.get('title')))
-        self.history_table.setItem(row_position, 1, QTableWidgetItem(item.get('url')))
-        self.history_table.setItem(row_position, 2, QTableWidgetItem(item.get('date')))
+        history_item = make_history_item(video_info)
+        row_id = self.history_store.append(history_item)
+        if self.history_model is not None:
+            self.history_model.prepend(row_id, history_item)
+
+    def open_history_entry(self, index):
+        url = self.history_model.url_at(index.row())
+        if not url or url == 'N/A' or not self.fetch_button.isEnabled():
+            return
+        self.url_input.setText(url)
+        self.tab_bar.setCurrentIndex(0)
+        self.fetch_video_info()
 
     def clear_history(self):
-        self.history_table.setRowCount(0)
-        if os.path.exists(self.history_file):
-            try:
-                os.remove(self.history_file)
-                self.status_label.setText("History cleared.")
-            except OSError as e:
-                print(f"Error removing history file: {e}")
+        try:
+            self.history_store.clear()
+            self.status_label.setText("History cleared.")
+        except sqlite3.Error as e:
+            print(f"Error clearing history store: {e}")
+        self.apply_history_filter()
+
+    def clear_metadata_cache(self):
+        self.metadata_cache.clear()
+        self.status_label.setText("Metadata cache cleared.")
+
+    def remove_partial_downloads(self):
+        # Partial files of queued or paused items are what lets them resume, so only clean up once nothing is left
+        if self.is_downloading or self.queue_store.has_unfinished():
+            self.status_label.setText("Finish or clear the queue before removing partial files.")
+            return
+        if not self.output_path or not os.path.isdir(self.output_path):
+            self.status_label.setText("Output folder not found.")
+            return
+        removed = remove_files(find_partial_files(self.output_path))
+        self.status_label.setText(f"Removed {removed} partial file(s).")
 
     def browse_settings_path(self):
         path = QFileDialog.getExistingDirectory(self, "Select Default Folder")
@@ -884,19 +4191,516 @@ class VideoDownloader(QWidget):
             self.path_edit.setText(path)
 
     def save_settings(self):
+        try:
+            parse_rate(self.rate_limit_edit.text())
+            parse_schedule(self.bandwidth_schedule_edit.text())
+        except ValueError as e:
+            self.status_label.setText(f"Settings not saved: {e}")
+            return
         self.settings.setValue("outputPath", self.path_edit.text())
         self.settings.setValue("filenameTemplate", self.filename_template_edit.text())
         self.settings.setValue("rateLimit", self.rate_limit_edit.text())
+        self.settings.setValue("maxConcurrentDownloads", self.max_workers_spin.value())
+        self.settings.setValue("progressRefreshRate", self.refresh_rate_spin.value())
+        self.settings.setValue("skipDownloaded", self.skip_downloaded_checkbox.isChecked())
+        self.settings.setValue("bandwidthSchedule", self.bandwidth_schedule_edit.text())
+        self.settings.setValue("maxConcurrentFragments", self.max_fragments_spin.value())
+        self.settings.setValue("fragmentAutoTune", self.fragment_auto_checkbox.isChecked())
+        self.settings.setValue("segmentedConnections", self.connections_spin.value())
+        self.settings.setValue("apiEnabled", self.api_enabled_checkbox.isChecked())
+        self.settings.setValue("apiPort", self.api_port_spin.value())
+        self.settings.setValue("apiToken", self.api_token_edit.text())
         self.load_settings()
         self.status_label.setText("Settings saved successfully.")
+        self.apply_api_settings()
 
     def closeEvent(self, event):
+        # Leave the queue journal as is so unfinished items are restored on the next launch
         if self.is_downloading:
-            self.stop_download()
+            self.halt_active_downloads()
+        for downloader_thread in list(self.halted_threads):
+            downloader_thread.wait()
+        self.postprocessing_queue.shutdown()
+        self.url_importer.shutdown()
+        if self.api_server is not None:
+            self.api_server.stop()
+        self.queue_store.close()
+        self.metadata_prefetcher.shutdown()
+        self.metadata_cache.close()
+        self.thumbnail_loader.shutdown()
+        self.history_store.close()
         event.accept()
 
+# --- COMMAND LINE ---
+
+def run_cli(argv):
+    settings = open_settings()
+    parser = argparse.ArgumentParser(description="Download videos without the GUI. Progress is printed as JSON lines.")
+    parser.add_argument('--cli', action='store_true', help="run in headless batch mode")
+    parser.add_argument('urls', nargs='*', help="video or playlist URLs")
+    parser.add_argument('-i', '--input-file', help="file with one URL per line ('-' for stdin)")
+    parser.add_argument('-f', '--format', choices=sorted(FORMAT_NAMES), default='mp4')
+    parser.add_argument('-q', '--quality', default='720p', help="maximum video height, e.g. 1080p")
+    parser.add_argument('-o', '--output', default=settings.value("outputPath", "", str))
+    parser.add_argument('-t', '--template', default=settings.value("filenameTemplate", DEFAULT_FILENAME_TEMPLATE, str))
+    parser.add_argument('-r', '--rate-limit', default=settings.value("rateLimit", "", str), help="total speed limit, e.g. 2M")
+    parser.add_argument('--schedule', default=settings.value("bandwidthSchedule", "", str),
+                        help="speed limits by time of day, e.g. '09:00-18:00=2M, 22:00-06:00=unlimited'")
+    parser.add_argument('-w', '--workers', type=int, default=settings.value("maxConcurrentDownloads", 1, int))
+    parser.add_argument('--fragments', type=int, default=settings.value("maxConcurrentFragments", DEFAULT_MAX_FRAGMENTS, int),
+                        help="maximum concurrent fragments per host for HLS/DASH streams")
+    parser.add_argument('--fixed-fragments', action='store_true', help="always use --fragments instead of auto-tuning")
+    parser.add_argument('-c', '--connections', type=int, default=settings.value("segmentedConnections", 1, int),
+                        help="split direct media files over this many connections (1 = off)")
+    parser.add_argument('--no-history', action='store_true', help="do not record downloads in the history")
+    parser.add_argument('--redownload', action='store_true', help="download videos even if they were downloaded before")
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.input_file:
+        urls.extend(read_url_file(args.input_file))
+    if not urls:
+        parser.error("no URLs given")
+    if not args.output:
+        parser.error("no output folder given and none set in Settings")
+    if not re.fullmatch(r'\d+p', args.quality):
+        parser.error(f"invalid quality '{args.quality}', use e.g. 1080p")
+    try:
+        bandwidth = BandwidthManager(parse_rate(args.rate_limit), parse_schedule(args.schedule))
+    except ValueError as e:
+        parser.error(str(e))
+
+    metadata_cache = MetadataCache(os.path.join(APP_DIR, "metadata_cache.sqlite3"))
+    history_store = HistoryStore(os.path.join(APP_DIR, "history.sqlite3"), legacy_json_path=os.path.join(APP_DIR, "history.json"))
+    downloader = BatchDownloader(args.output, args.template, args.rate_limit, max(1, args.workers),
+                                 metadata_cache=metadata_cache, history_store=history_store,
+                                 record_history=not args.no_history, skip_downloaded=not args.redownload, bandwidth=bandwidth,
+                                 connections=max(1, args.connections),
+                                 metrics=MetricsRecorder(os.path.join(APP_DIR, "metrics.jsonl"), os.path.join(APP_DIR, "metrics.prom")),
+                                 fragments=FragmentTuner(args.fragments, auto=settings.value("fragmentAutoTune", True, bool) and not args.fixed_fragments),
+                                 refresh_rate=settings.value("progressRefreshRate", DEFAULT_PROGRESS_REFRESH_RATE, int))
+    items = []
+    for url in urls:
+        items.extend(downloader.expand(url, FORMAT_NAMES[args.format], args.quality))
+    _, failed = downloader.run(items)
+
+    metadata_cache.close()
+    history_store.close()
+    return 1 if failed else 0
+
+# --- BENCHMARK ---
+
+BENCHMARK_BLOCK = bytes(range(256)) * 256
+
+def synthetic_chunks(start, end):
+    # The same bytes at the same offsets on every request, so ranged and resumed reads line up
+    position = start
+    while position < end:
+        offset = position % len(BENCHMARK_BLOCK)
+        chunk = BENCHMARK_BLOCK[offset:offset + end - position]
+        yield chunk
+        position += len(chunk)
+
+class BenchmarkServer:
+    # Local stand-in for a video site: JSON pages for the stub extractor, progressive files with range support and HLS streams.
+    # Video ids starting with 'h' are HLS, all others progressive.
+    def __init__(self, video_size, hls_segments):
+        import http.server
+        self.video_size = video_size
+        self.hls_segments = max(1, hls_segments)
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler(http.server.BaseHTTPRequestHandler))
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def video_info(self, video_id):
+        if video_id.startswith('h'):
+            # .ts rather than .mp4, so yt-dlp does not try an ffmpeg fixup of the synthetic bytes
+            media = {'format_id': 'hls-720', 'url': f"{self.base_url}/hls/{video_id}.m3u8", 'ext': 'ts', 'protocol': 'm3u8_native'}
+        else:
+            media = {'format_id': 'http-720', 'url': f"{self.base_url}/media/{video_id}.mp4", 'ext': 'mp4', 'filesize': self.video_size}
+        media.update({'width': 1280, 'height': 720, 'vcodec': 'avc1.64001f', 'acodec': 'mp4a.40.2'})
+        return {'id': video_id, 'title': f"Benchmark video {video_id}", 'duration': 60, 'formats': [media]}
+
+    def playlist_info(self, size):
+        video_ids = [('h' if i % 2 else 'p') + str(i) for i in range(size)]
+        return {'_type': 'playlist', 'id': f"playlist{size}", 'title': f"Benchmark playlist ({size} videos)",
+                'entries': [{'_type': 'url', 'ie_key': 'Benchmark', 'id': video_id, 'title': f"Benchmark video {video_id}",
+                             'url': f"{self.base_url}/bench/video/{video_id}"} for video_id in video_ids]}
+
+    def hls_playlist(self, video_id):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:6", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(self.hls_segments):
+            lines += ["#EXTINF:6.0,", f"{video_id}/{i}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def make_handler(self, base_handler):
+        server = self
+        routes = [
+            (re.compile(r'/bench/playlist/(\d+)'), lambda m: ('json', server.playlist_info(int(m.group(1))))),
+            (re.compile(r'/bench/video/(\w+)'), lambda m: ('json', server.video_info(m.group(1)))),
+            (re.compile(r'/media/\w+\.mp4'), lambda m: ('media', server.video_size)),
+            (re.compile(r'/hls/(\w+)\.m3u8'), lambda m: ('m3u8', server.hls_playlist(m.group(1)))),
+            (re.compile(r'/hls/\w+/\d+\.ts'), lambda m: ('media', server.video_size // server.hls_segments)),
+        ]
+
+        class Handler(base_handler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond()
+
+            def respond(self, head=False):
+                path = urllib.parse.urlsplit(self.path).path
+                for pattern, route in routes:
+                    match = pattern.fullmatch(path)
+                    if match:
+                        break
+                else:
+                    return self.send_body(404, b"Not found", 'text/plain', head)
+                kind, value = route(match)
+                if kind == 'json':
+                    return self.send_body(200, json.dumps(value).encode('utf-8'), 'application/json', head)
+                if kind == 'm3u8':
+                    return self.send_body(200, value.encode('utf-8'), 'application/vnd.apple.mpegurl', head)
+                self.send_media(value, 'video/mp4' if path.endswith('.mp4') else 'video/mp2t', head)
+
+            def send_body(self, status, body, content_type, head):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+            def send_media(self, size, content_type, head):
+                start, end = 0, size
+                match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if match:
+                    start, end = int(match.group(1)), min(int(match.group(2) or size - 1) + 1, size)
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f"bytes */{size}")
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                self.send_response(206 if match else 200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(end - start))
+                self.send_header('Accept-Ranges', 'bytes')
+                if match:
+                    self.send_header('Content-Range', f"bytes {start}-{end - 1}/{size}")
+                self.end_headers()
+                if head:
+                    return
+                try:
+                    for chunk in synthetic_chunks(start, end):
+                        self.wfile.write(chunk)
+                except (ConnectionResetError, BrokenPipeError):
+                    # Paused, cancelled and probing clients hang up mid-body
+                    self.close_connection = True
+
+        return Handler
+
+def install_benchmark_extractor():
+    # The stub extractor reads the server's JSON pages; it goes ahead of the generic extractor, which accepts any URL
+    yt_dlp = load_yt_dlp()
+
+    class BenchmarkIE(yt_dlp.extractor.common.InfoExtractor):
+        IE_NAME = 'Benchmark'
+        _VALID_URL = r'http://127\.0\.0\.1:\d+/bench/(?:video|playlist)/(?P<id>\w+)'
+
+        def _real_extract(self, url):
+            return self._download_json(url, self._match_id(url))
+
+    class BenchmarkYoutubeDL(yt_dlp.YoutubeDL):
+        def add_default_info_extractors(self):
+            self.add_info_extractor(BenchmarkIE())
+            super().add_default_info_extractors()
+
+    yt_dlp.YoutubeDL = BenchmarkYoutubeDL
+
+def run_event_loop_until(done, timeout):
+    # Runs the Qt event loop until done() is true; a timer that should fire every BENCHMARK_TICK_MS shows how long the GUI stalls
+    loop = QEventLoop()
+    gaps = []
+    last_tick = [time.perf_counter()]
+
+    def tick():
+        now = time.perf_counter()
+        gaps.append(now - last_tick[0])
+        last_tick[0] = now
+        if done():
+            loop.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(tick)
+    timer.start(BENCHMARK_TICK_MS)
+    QTimer.singleShot(int(timeout * 1000), loop.quit)
+    loop.exec_()
+    timer.stop()
+    stalls = [max(gap * 1000 - BENCHMARK_TICK_MS, 0) for gap in gaps]
+    return {'timed_out': not done(), 'max_stall_ms': round(max(stalls, default=0), 1),
+            'stalls_over_100ms': sum(1 for stall in stalls if stall > 100)}
+
+def folder_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def benchmark_download(server, args, work_dir):
+    result = {}
+    for kind, video_id in (('progressive', 'p0'), ('hls', 'h0')):
+        output_path = os.path.join(work_dir, f"download-{kind}")
+        os.makedirs(output_path)
+        info = extract_info_cached(f"{server.base_url}/bench/video/{video_id}", {'quiet': True})
+        info.update(selected_format_text=FORMAT_CHOICES[0], selected_quality='720p')
+        downloader_thread = DownloaderThread(info, resolve_format_selection(info), output_path, DEFAULT_FILENAME_TEMPLATE, '',
+                                             fragments=FragmentTuner(args.fragments), connections=args.connections)
+        outcome = []
+        downloader_thread.finished.connect(lambda success, message, _: outcome.append((success, message)))
+        started = time.perf_counter()
+        downloader_thread.start()
+        loop_stats = run_event_loop_until(lambda: outcome, args.timeout)
+        downloader_thread.wait()
+        success, message = outcome[0] if outcome else (False, "Timed out")
+        if success:
+            success, message = downloader_thread.job.postprocess()
+        seconds = time.perf_counter() - started
+        size = folder_size(output_path)
+        result.update({f"{kind}_success": success, f"{kind}_seconds": round(seconds, 3),
+                       f"{kind}_throughput": round(size / seconds), f"{kind}_max_stall_ms": loop_stats['max_stall_ms']})
+        if not success:
+            result[f"{kind}_message"] = message
+    return result
+
+def benchmark_queue(window, server, args, work_dir):
+    window.output_path = os.path.join(work_dir, "queue")
+    os.makedirs(window.output_path)
+    playlist = extract_info_cached(f"{server.base_url}/bench/playlist/{args.videos}", {'quiet': True, 'extract_flat': 'in_playlist'})
+    items = [dict(entry, selected_format_text=FORMAT_CHOICES[0], selected_quality='720p') for entry in playlist['entries']]
+    window.queue_store.add(items)
+    window.download_queue = list(items)
+    window.ensure_tab_built(1)
+    window.populate_queue_table()
+    started = time.perf_counter()
+    window.start_queue_download()
+    loop_stats = run_event_loop_until(lambda: not window.is_downloading, args.timeout)
+    seconds = time.perf_counter() - started
+    if window.is_downloading:
+        window.halt_active_downloads()
+    size = folder_size(window.output_path)
+    session = window.metrics.session()
+    return {
+        'items': len(items),
+        'completed': session['jobs'].get('completed', 0),
+        'failed': window.failed_count,
+        'seconds': round(seconds, 3),
+        'items_per_second': round(len(items) / seconds, 2),
+        'throughput': round(size / seconds),
+        'mean_metadata_seconds': round(session['means'].get('metadata_seconds', 0), 3),
+        'mean_time_to_first_byte': round(session['means'].get('time_to_first_byte', 0), 3),
+        **loop_stats,
+    }
+
+def benchmark_import(window, server, args, work_dir):
+    path = os.path.join(work_dir, "urls.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{server.base_url}/bench/video/p{i}\n" for i in range(args.import_urls))
+    queued_before = len(window.download_queue)
+    started = time.perf_counter()
+    window.import_urls(read_url_file(path), os.path.basename(path))
+    loop_stats = run_event_loop_until(lambda: not window.url_importer.running, args.timeout)
+    seconds = time.perf_counter() - started
+    return {'urls': args.import_urls, 'queued': len(window.download_queue) - queued_before,
+            'failed': window.import_counts['failed'], 'seconds': round(seconds, 3),
+            'urls_per_second': round(args.import_urls / seconds, 1), **loop_stats}
+
+def benchmark_history(window, args):
+    window.ensure_tab_built(2)
+    started = time.perf_counter()
+    for i in range(args.history_entries):
+        window.add_to_history({'title': f"Benchmark video {i}", 'webpage_url': f"https://example.com/watch?v={i}"})
+    append_seconds = time.perf_counter() - started
+    # First page as the history tab shows it, then every page as if scrolled to the end
+    started = time.perf_counter()
+    window.load_history()
+    window.history_model.fetchMore()
+    load_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    while window.history_model.canFetchMore():
+        window.history_model.fetchMore()
+    scroll_seconds = time.perf_counter() - started
+    window.history_search_edit.setText("video 42")
+    window.history_search_timer.stop()
+    started = time.perf_counter()
+    window.apply_history_filter()
+    window.history_model.fetchMore()
+    search_seconds = time.perf_counter() - started
+    return {'entries': args.history_entries, 'append_seconds': round(append_seconds, 3),
+            'append_ms_per_entry': round(append_seconds * 1000 / max(args.history_entries, 1), 3),
+            'load_seconds': round(load_seconds, 4), 'scroll_all_seconds': round(scroll_seconds, 4),
+            'search_seconds': round(search_seconds, 4)}
+
+def benchmark_playlist(window, server, args, app):
+    window.tab_bar.setCurrentIndex(0)
+    # Streamed listing through the Downloader tab: how soon the first rows show up, and how long the whole list takes
+    window.url_input.setText(f"{server.base_url}/bench/playlist/{args.playlist_size}")
+    started = time.perf_counter()
+    window.fetch_video_info()
+    run_event_loop_until(lambda: window.playlist_model.rowCount() or not window.is_fetching_info, args.timeout)
+    first_page_seconds = time.perf_counter() - started
+    loop_stats = run_event_loop_until(lambda: not window.is_fetching_info, args.timeout)
+    stream_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    playlist = extract_info_cached(f"{server.base_url}/bench/playlist/{args.playlist_size}", {'quiet': True, 'extract_flat': 'in_playlist'})
+    extract_seconds = time.perf_counter() - started
+    window.playlist_items = [entry for entry in playlist['entries'] if entry]
+    started = time.perf_counter()
+    window.populate_playlist_view()
+    app.processEvents()
+    populate_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    window.set_visible_playlist_items_checked(True)
+    app.processEvents()
+    select_seconds = time.perf_counter() - started
+    return {'entries': len(window.playlist_items), 'first_page_seconds': round(first_page_seconds, 3),
+            'stream_seconds': round(stream_seconds, 3), 'extract_seconds': round(extract_seconds, 3), **loop_stats,
+            'populate_seconds': round(populate_seconds, 4), 'select_all_seconds': round(select_seconds, 4)}
+
+def peak_memory():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS; the resource module does not exist on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def compare_results(before, after):
+    changes = {}
+    for key, value in after.items():
+        previous = before.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(previous, (int, float)):
+            continue
+        change = round((value - previous) / previous * 100, 1) if previous else None
+        changes[key] = {'before': previous, 'after': value, 'change_percent': change}
+    return changes
+
+def run_benchmark(argv):
+    import shutil
+    import tempfile
+    import tracemalloc
+    global APP_DIR
+    parser = argparse.ArgumentParser(description="Run offline benchmarks against a local fake media server. Results are printed as JSON lines.")
+    parser.add_argument('--benchmark', nargs='*', choices=BENCHMARKS, help="benchmarks to run (default: all)")
+    parser.add_argument('--videos', type=int, default=20, help="queue benchmark size; every other video is HLS")
+    parser.add_argument('--video-size', type=float, default=8, help="size of each synthetic video in MiB")
+    parser.add_argument('--hls-segments', type=int, default=10, help="segments per HLS video")
+    parser.add_argument('--playlist-size', type=int, default=2000)
+    parser.add_argument('--import-urls', type=int, default=2000, help="lines in the bulk import benchmark's URL file")
+    parser.add_argument('--history-entries', type=int, default=5000)
+    parser.add_argument('-w', '--workers', type=int, default=3)
+    parser.add_argument('--fragments', type=int, default=DEFAULT_MAX_FRAGMENTS, help="maximum concurrent fragments per host")
+    parser.add_argument('-c', '--connections', type=int, default=1, help="connections per progressive file (1 = off)")
+    parser.add_argument('--timeout', type=float, default=600, help="seconds before a download benchmark gives up")
+    parser.add_argument('--trace-memory', action='store_true', help="also report each benchmark's peak Python heap (slower)")
+    parser.add_argument('--label', help="stored with the results, e.g. a version or commit")
+    parser.add_argument('-o', '--output', help="also write the results to this file")
+    parser.add_argument('--compare', help="results file from an earlier run to compare against")
+    args = parser.parse_args(argv)
+    selected = args.benchmark or list(BENCHMARKS)
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = {record['benchmark']: record for record in map(json.loads, f) if 'benchmark' in record}
+
+    # Stores, caches and downloads go to a scratch folder so the real history and queue are never touched
+    work_dir = tempfile.mkdtemp(prefix="av-benchmark-")
+    APP_DIR = work_dir
+    # The same goes for settings: the window reads and saves an empty INI file there, and the Local API stays off
+    QSettings.setDefaultFormat(QSettings.IniFormat)
+    QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, work_dir)
+    install_benchmark_extractor()
+    server = BenchmarkServer(int(args.video_size * 1024 * 1024), args.hls_segments).start()
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    window = VideoDownloader()
+    window.filename_template = DEFAULT_FILENAME_TEMPLATE
+    window.rate_limit = ''
+    window.bandwidth.configure()
+    window.max_workers = max(1, args.workers)
+    window.fragment_tuner.configure(args.fragments, True)
+    window.segmented_connections = max(1, args.connections)
+    window.skip_downloaded = False
+    window.api_enabled = False
+    window.apply_api_settings()
+    window.show()
+    app.processEvents()
+
+    benchmarks = {
+        'download': lambda: benchmark_download(server, args, work_dir),
+        'queue': lambda: benchmark_queue(window, server, args, work_dir),
+        'import': lambda: benchmark_import(window, server, args, work_dir),
+        'history': lambda: benchmark_history(window, args),
+        'playlist': lambda: benchmark_playlist(window, server, args, app),
+    }
+    results = []
+    try:
+        for name in selected:
+            if args.trace_memory:
+                tracemalloc.start()
+            record = {'benchmark': name, 'label': args.label, **benchmarks[name](), 'peak_rss_mb': peak_memory()}
+            if args.trace_memory:
+                record['python_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+                tracemalloc.stop()
+            if name in baseline:
+                record['changes'] = compare_results(baseline[name], record)
+            results.append(record)
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+    finally:
+        window.close()
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for record in results:
+                record = {key: value for key, value in record.items() if key != 'changes'}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return 0
+
 if __name__ == '__main__':
+    if '--cli' in sys.argv[1:]:
+        sys.exit(run_cli(sys.argv[1:]))
+    if '--benchmark' in sys.argv[1:]:
+        sys.exit(run_benchmark(sys.argv[1:]))
+    profile_startup = '--profile-startup' in sys.argv[1:]
     app = QApplication(sys.argv)
+    mark_startup("QApplication")
+    threading.Thread(target=preload_yt_dlp, args=(profile_startup,), daemon=True).start()
     ex = VideoDownloader()
-    ex.show()
+    if '--api' in sys.argv[1:]:
+        # Daemon mode: the local API is on for this run and the window starts minimized
+        ex.api_enabled = True
+        ex.apply_api_settings()
+        if ex.api_server is not None:
+            print(f"Local API listening on http://{API_HOST}:{ex.api_port} (token: {ex.api_token})", flush=True)
+        ex.showMinimized()
+    else:
+        ex.show()
+    mark_startup("window shown")
+    if profile_startup:
+        QTimer.singleShot(0, lambda: (mark_startup("event loop idle"), print_startup_profile()))
     sys.exit(app.exec_())
\ No newline at end of file